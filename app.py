@@ -1,8 +1,30 @@
-from flask import Flask, request, jsonify, render_template, make_response
+from flask import Flask, request, jsonify, render_template, make_response, Response, g, has_request_context
 from flask_cors import CORS
+from werkzeug.middleware.proxy_fix import ProxyFix
 from openai import OpenAI
-import os, json, re, base64
-from datetime import datetime
+import os, json, re, base64, zlib, hashlib
+import time, random, threading, functools, contextlib, collections
+import concurrent.futures
+import asyncio, io, queue, shutil, zipfile, gzip, mimetypes, csv, sys, glob, struct
+import click
+import tracemalloc
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+try:
+    import brotli  # 선택: 설치되어 있으면 정적 자산을 br 로도 미리 압축
+except ImportError:
+    brotli = None
+try:
+    import redis  # 선택: CACHE_BACKEND=redis 일 때만 사용
+except ImportError:
+    redis = None
+try:
+    import fcntl
+except ImportError:  # Windows 개발 환경: 파일 잠금 없이 프로세스 내부에서만 동작
+    fcntl = None
+from datetime import datetime, timedelta
 from playwright.sync_api import sync_playwright
 from flask import send_file
 import tempfile
@@ -53,8 +75,12 @@ from flask_login import (
     LoginManager, login_user, logout_user, login_required,
     current_user, UserMixin
 )
-from sqlalchemy import create_engine, Column, Integer, String, DateTime, Text
+from sqlalchemy import (
+    create_engine, event, text, select, and_, or_, func,
+    Column, Integer, BigInteger, String, DateTime, Text, LargeBinary, Index
+)
 from sqlalchemy.orm import sessionmaker, declarative_base
+from sqlalchemy.engine import Engine
 from passlib.hash import bcrypt
 
 # ---------------------------------------------------------------------
@@ -68,6 +94,14 @@ app = Flask(
 )
 app.config["MAX_CONTENT_LENGTH"] = 50 * 1024 * 1024
 
+# 🧭 리버스 프록시(Render 등) 뒤에서 실제 클라이언트 IP 사용
+#   X-Forwarded-For 중 신뢰하는 프록시가 덧붙인 오른쪽 hop 만 remote_addr 로 반영
+#   (맨 왼쪽 값은 클라이언트가 임의로 넣을 수 있으므로 사용하지 않음)
+#   기본 0: 프록시 없이 직접 노출되면 헤더를 믿지 않음 → 배포 환경에서 hop 수를 지정 (Render 는 1)
+TRUSTED_PROXY_HOPS = int(os.environ.get("TRUSTED_PROXY_HOPS", "0"))
+if TRUSTED_PROXY_HOPS > 0:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=TRUSTED_PROXY_HOPS)
+
 # 🔐 세션/쿠키 설정 (크로스 도메인에서 쿠키가 안 실리는 문제 해결)
 app.config.update(
     SECRET_KEY=os.environ.get("SECRET_KEY", "dev-secret-key"),
@@ -91,7 +125,846 @@ CORS(
 )
 # OpenAI
 OPENAI_API_KEY = os.environ.get("OPENAI_API_KEY", "")
-client = OpenAI(api_key=OPENAI_API_KEY) if OPENAI_API_KEY else None
+# LLM 기록/재생: record = 실제 호출을 디스크에 기록, replay = 기록된 응답만 사용 (네트워크 없음)
+LLM_REPLAY_MODE = os.environ.get("LLM_REPLAY_MODE", "").lower()
+LLM_REPLAY_DIR = os.environ.get("LLM_REPLAY_DIR", os.path.join(BASE_DIR, "llm_replay"))
+LLM_REPLAY_LATENCY_SCALE = float(os.environ.get("LLM_REPLAY_LATENCY_SCALE", "1"))  # 0 이면 지연 없이 재생
+# replay 모드는 API 키 없이도 LLM 경로가 동작하도록 더미 키로 클라이언트 생성 (실제 호출은 하지 않음)
+client = (
+    OpenAI(api_key=OPENAI_API_KEY or "replay")
+    if OPENAI_API_KEY or LLM_REPLAY_MODE == "replay"
+    else None
+)
+
+# ---------------------------------------------------------------------
+# 📊 Metrics (프로세스 내 카운터/지연 시간 통계)
+# ---------------------------------------------------------------------
+METRICS_RESERVOIR = 512  # 분위수 계산용 최근 관측값 개수
+
+_metrics_lock = threading.Lock()
+_metrics_counters = {}
+_metrics_timings = {}
+
+def _metric_key(name: str, labels: dict) -> str:
+    if not labels:
+        return name
+    return name + "{" + ",".join(f"{k}={v}" for k, v in sorted(labels.items())) + "}"
+
+def metric_inc(name: str, n: int = 1, **labels):
+    key = _metric_key(name, labels)
+    with _metrics_lock:
+        _metrics_counters[key] = _metrics_counters.get(key, 0) + n
+
+def metric_observe(name: str, value: float, **labels):
+    """지연 시간 등 관측값 기록 (최근 METRICS_RESERVOIR개만 보관)"""
+    key = _metric_key(name, labels)
+    with _metrics_lock:
+        t = _metrics_timings.get(key)
+        if t is None:
+            t = _metrics_timings[key] = {"count": 0, "sum": 0.0, "max": 0.0, "recent": collections.deque(maxlen=METRICS_RESERVOIR)}
+        t["count"] += 1
+        t["sum"] += value
+        t["max"] = max(t["max"], value)
+        t["recent"].append(value)
+
+def metric_quantile(name: str, q: float, default=None, **labels):
+    """최근 관측값 기준 분위수 (관측값이 없으면 default)"""
+    key = _metric_key(name, labels)
+    with _metrics_lock:
+        t = _metrics_timings.get(key)
+        recent = list(t["recent"]) if t else []
+    if len(recent) < 20:
+        return default
+    return float(np.quantile(recent, q))
+
+def metrics_snapshot() -> dict:
+    with _metrics_lock:
+        counters = dict(_metrics_counters)
+        timings = {k: (dict(v), list(v["recent"])) for k, v in _metrics_timings.items()}
+    out = {}
+    for k, (t, recent) in timings.items():
+        arr = np.array(recent) if recent else np.zeros(1)
+        out[k] = {
+            "count": t["count"],
+            "mean": round(t["sum"] / t["count"], 4) if t["count"] else 0.0,
+            "max": round(t["max"], 4),
+            "p50": round(float(np.quantile(arr, 0.5)), 4),
+            "p95": round(float(np.quantile(arr, 0.95)), 4),
+            "p99": round(float(np.quantile(arr, 0.99)), 4),
+        }
+    return {"pid": os.getpid(), "counters": counters, "timings": out}
+
+# ---------------------------------------------------------------------
+# 🔬 요청 프로파일링 (관리자용)
+#   - 관리자가 X-Profile: 1 헤더를 보내거나 PROFILE_SAMPLE_RATE 확률로 샘플링
+#   - 프로파일 중인 요청만 스택 샘플링 스레드 + 단계 타이머 + DB 시간 집계
+#   - 결과는 PROFILE_DIR 에 최근 PROFILE_RING_SIZE 개만 보관 (오래된 것부터 삭제)
+#   - 꺼져 있으면 요청당 random() 한 번 + g 조회 정도만 추가됨
+# ---------------------------------------------------------------------
+PROFILE_SAMPLE_RATE = float(os.environ.get("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_DIR = os.environ.get("PROFILE_DIR", os.path.join(tempfile.gettempdir(), "essay_profiles"))
+PROFILE_RING_SIZE = int(os.environ.get("PROFILE_RING_SIZE", "200"))
+PROFILE_INTERVAL_MS = float(os.environ.get("PROFILE_INTERVAL_MS", "5"))
+PROFILE_HEADER = "X-Profile"
+
+class _StackSampler(threading.Thread):
+    """대상 스레드의 스택을 주기적으로 찍어 folded 형식(a;b;c → 횟수)으로 집계"""
+
+    def __init__(self, thread_id: int, interval: float):
+        super().__init__(daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.folded = collections.Counter()
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            if stack:
+                self.folded[";".join(reversed(stack))] += 1
+
+    def stop(self) -> dict:
+        self._stop_event.set()
+        self.join()
+        return dict(self.folded)
+
+def _profile_current():
+    return g.get("_profile") if has_request_context() else None
+
+@contextlib.contextmanager
+def profile_stage(name: str):
+    """프로파일 중인 요청이면 구간 시간을 기록 (아니면 아무것도 하지 않음)"""
+    prof = _profile_current()
+    if prof is None:
+        yield
+        return
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        t1 = time.perf_counter()
+        prof["stages"].append({
+            "name": name,
+            "start_ms": round((t0 - prof["t0"]) * 1000, 2),
+            "ms": round((t1 - t0) * 1000, 2),
+        })
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _profile_db_before(conn, cursor, statement, parameters, context, executemany):
+    if _profile_current() is not None:
+        conn.info.setdefault("_profile_t0", []).append(time.perf_counter())
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _profile_db_after(conn, cursor, statement, parameters, context, executemany):
+    prof = _profile_current()
+    starts = conn.info.get("_profile_t0")
+    if prof is None or not starts:
+        return
+    prof["db"]["queries"] += 1
+    prof["db"]["ms"] += (time.perf_counter() - starts.pop()) * 1000
+
+@app.before_request
+def _profile_start():
+    trigger = None
+    if request.headers.get(PROFILE_HEADER) == "1":
+        # 헤더 트리거는 관리자만 (그 외에는 조용히 무시)
+        if current_user.is_authenticated and _is_admin(current_user):
+            trigger = "header"
+    elif PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE:
+        trigger = "sample"
+    if trigger is None:
+        return
+    sampler = _StackSampler(threading.get_ident(), PROFILE_INTERVAL_MS / 1000)
+    g._profile = {
+        "id": f"{time.time_ns()}_{os.getpid()}",
+        "trigger": trigger,
+        "t0": time.perf_counter(),
+        "started_at": datetime.utcnow().isoformat(),
+        "stages": [],
+        "db": {"queries": 0, "ms": 0.0},
+        "sampler": sampler,
+    }
+    sampler.start()
+
+def _profile_finish(status: int):
+    prof = g.pop("_profile", None)
+    if prof is None:
+        return None
+    folded = prof.pop("sampler").stop()
+    record = {
+        "id": prof["id"],
+        "trigger": prof["trigger"],
+        "method": request.method,
+        "path": request.path,
+        "endpoint": request.endpoint,
+        "status": status,
+        "started_at": prof["started_at"],
+        "wall_ms": round((time.perf_counter() - prof["t0"]) * 1000, 2),
+        "stages": prof["stages"],
+        "db": {"queries": prof["db"]["queries"], "ms": round(prof["db"]["ms"], 2)},
+        "interval_ms": PROFILE_INTERVAL_MS,
+        "samples": sum(folded.values()),
+        "folded": folded,
+    }
+    try:
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        path = os.path.join(PROFILE_DIR, f"{record['id']}.json")
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(record, f, ensure_ascii=False)
+        os.replace(path + ".tmp", path)
+        # 링 버퍼: 가장 오래된 파일부터 정리
+        files = sorted(glob.glob(os.path.join(PROFILE_DIR, "*.json")))
+        for old in files[:-PROFILE_RING_SIZE]:
+            try:
+                os.remove(old)
+            except OSError:
+                pass
+    except OSError as e:
+        print("❗ 프로파일 저장 실패:", e, flush=True)
+    return record["id"]
+
+@app.after_request
+def _profile_after(resp):
+    profile_id = _profile_finish(resp.status_code)
+    if profile_id:
+        resp.headers["X-Profile-Id"] = profile_id
+    return resp
+
+@app.teardown_request
+def _profile_teardown(exc):
+    # 처리되지 않은 예외로 after_request 가 건너뛰어진 경우
+    if exc is not None and _profile_current() is not None:
+        _profile_finish(500)
+
+def _load_profiles():
+    out = []
+    for path in glob.glob(os.path.join(PROFILE_DIR, "*.json")):
+        try:
+            with open(path, encoding="utf-8") as f:
+                out.append(json.load(f))
+        except (OSError, ValueError):
+            continue  # 다른 워커가 막 지운 파일
+    return out
+
+# ---------------------------------------------------------------------
+# 🗄️ 공유 캐시 (L1: 프로세스 내 LRU, L2: 워커 간 공유 저장소)
+#   - L2 backend: file (기본, /dev/shm 이 있으면 공유 메모리 위에 둠) | redis | none
+#   - L1/L2 모두 바이트 한도 초과 시 오래 안 쓴 것부터 제거
+#   - L1 은 다른 워커의 삭제를 모르므로 CACHE_L1_TTL_SEC 이상 들고 있지 않음
+#   - 적중/실패는 메트릭(cache{ns,result})으로 집계, GET /admin/cache 에서 확인
+#   - 값은 JSON 으로만 저장 (pickle 금지: 공유 저장소 내용이 코드 실행으로 이어지지 않도록)
+#   - file backend 는 디렉터리 소유자가 현재 사용자이고 group/other 쓰기 권한이 없을 때만 사용
+# ---------------------------------------------------------------------
+CACHE_BACKEND = os.environ.get("CACHE_BACKEND", "file")
+CACHE_DIR = os.environ.get("CACHE_DIR", os.path.join(
+    "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir(), "essay_shared_cache"))
+CACHE_REDIS_URL = os.environ.get("CACHE_REDIS_URL", "redis://localhost:6379/0")
+CACHE_L1_BYTES = int(os.environ.get("CACHE_L1_BYTES", str(32 * 1024 * 1024)))
+CACHE_L2_BYTES = int(os.environ.get("CACHE_L2_BYTES", str(256 * 1024 * 1024)))
+CACHE_L1_TTL_SEC = float(os.environ.get("CACHE_L1_TTL_SEC", "30"))
+# 같은 호스트에서 DB 가 다른 앱끼리 키가 섞이지 않도록 접두어 분리
+CACHE_NAMESPACE = os.environ.get("CACHE_NAMESPACE") or hashlib.sha256(
+    (os.environ.get("DATABASE_URL") or BASE_DIR).encode("utf-8")).hexdigest()[:8]
+_CACHE_HEADER = struct.Struct("<d")  # 만료 시각 (0 = 만료 없음)
+
+class SharedCache:
+    def __init__(self, backend: str):
+        self._lock = threading.Lock()
+        self._l1 = collections.OrderedDict()  # key → (만료 시각, 크기, 값)
+        self._l1_bytes = 0
+        self._l2_written = 0
+        self._redis = None
+        if backend == "redis":
+            if redis is None:
+                print("❗ redis 패키지가 없어 파일 캐시로 대체합니다.", flush=True)
+                backend = "file"
+            else:
+                self._redis = redis.Redis.from_url(CACHE_REDIS_URL)
+        if backend == "file" and not self._safe_cache_dir():
+            backend = "none"
+        self.backend = backend
+
+    @staticmethod
+    def _safe_cache_dir() -> bool:
+        """다른 사용자가 만들었거나 쓸 수 있는 디렉터리면 L2 를 쓰지 않음 (캐시 오염 방지)"""
+        try:
+            os.makedirs(CACHE_DIR, mode=0o700, exist_ok=True)
+            st = os.stat(CACHE_DIR)
+        except OSError as e:
+            print("❗ 공유 캐시 디렉터리 생성 실패 (L1 만 사용):", e, flush=True)
+            return False
+        if hasattr(os, "getuid") and (st.st_uid != os.getuid() or st.st_mode & 0o022):
+            print(f"❗ 공유 캐시 디렉터리 권한이 안전하지 않아 L1 만 사용합니다: {CACHE_DIR}", flush=True)
+            return False
+        return True
+
+    # ----- L1 -----
+    def _l1_get(self, key: str):
+        with self._lock:
+            e = self._l1.get(key)
+            if e is None:
+                return None
+            if e[0] < time.time():
+                self._l1_drop(key)
+                return None
+            self._l1.move_to_end(key)
+            return e
+
+    def _l1_put(self, key: str, value, size: int, expires: float):
+        if size > CACHE_L1_BYTES // 4:
+            return  # 너무 큰 값은 L2 에만
+        expires = min(expires, time.time() + CACHE_L1_TTL_SEC) if expires else time.time() + CACHE_L1_TTL_SEC
+        with self._lock:
+            self._l1_drop(key)
+            self._l1[key] = (expires, size, value)
+            self._l1_bytes += size
+            while self._l1_bytes > CACHE_L1_BYTES and self._l1:
+                self._l1_drop(next(iter(self._l1)))
+                metric_inc("cache_evictions", tier="l1")
+
+    def _l1_drop(self, key: str):
+        e = self._l1.pop(key, None)
+        if e is not None:
+            self._l1_bytes -= e[1]
+
+    # ----- L2 -----
+    def _l2_path(self, key: str) -> str:
+        return os.path.join(CACHE_DIR, hashlib.sha256(key.encode("utf-8")).hexdigest()[:40])
+
+    def _l2_get(self, key: str):
+        if self.backend == "redis":
+            try:
+                return self._redis.get(key)
+            except Exception as e:
+                print("❗ redis 캐시 조회 실패:", e, flush=True)
+                return None
+        if self.backend != "file":
+            return None
+        path = self._l2_path(key)
+        try:
+            with open(path, "rb") as f:
+                blob = f.read()
+        except OSError:
+            return None
+        if len(blob) < _CACHE_HEADER.size:
+            # 쓰다 만 파일·다른 프로그램의 파일 등 → 미스로 보고 삭제
+            self._l2_delete(key)
+            return None
+        expires = _CACHE_HEADER.unpack_from(blob)[0]
+        if expires and expires < time.time():
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            return None
+        try:
+            os.utime(path)  # LRU 정리 기준 (mtime = 마지막 사용 시각)
+        except OSError:
+            pass
+        return blob[_CACHE_HEADER.size:]
+
+    def _l2_delete(self, key: str):
+        if self.backend == "redis":
+            try:
+                self._redis.delete(key)
+            except Exception:
+                pass
+        elif self.backend == "file":
+            try:
+                os.remove(self._l2_path(key))
+            except OSError:
+                pass
+
+    def _l2_set(self, key: str, blob: bytes, ttl):
+        if self.backend == "redis":
+            try:
+                self._redis.set(key, blob, ex=int(ttl) if ttl else None)
+            except Exception as e:
+                print("❗ redis 캐시 저장 실패:", e, flush=True)
+            return
+        if self.backend != "file":
+            return
+        path = self._l2_path(key)
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(_CACHE_HEADER.pack(time.time() + ttl if ttl else 0))
+            f.write(blob)
+        os.replace(tmp, path)
+        with self._lock:
+            self._l2_written += len(blob)
+            sweep = self._l2_written > CACHE_L2_BYTES // 8
+            if sweep:
+                self._l2_written = 0
+        if sweep:
+            self._l2_sweep()
+
+    def _l2_sweep(self):
+        """L2 디렉터리가 한도를 넘으면 마지막 사용이 오래된 파일부터 삭제 (한 워커만 수행)"""
+        lock_path = os.path.join(CACHE_DIR, ".sweep.lock")
+        with open(lock_path, "a") as lf:
+            if fcntl is not None:
+                try:
+                    fcntl.flock(lf, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except OSError:
+                    return  # 다른 워커가 정리 중
+            files = []
+            total = 0
+            for entry in os.scandir(CACHE_DIR):
+                if entry.name.startswith(".") or entry.name.endswith(".tmp"):
+                    continue
+                try:
+                    st = entry.stat()
+                except OSError:
+                    continue
+                files.append((st.st_mtime, st.st_size, entry.path))
+                total += st.st_size
+            if total <= CACHE_L2_BYTES:
+                return
+            files.sort()
+            target = CACHE_L2_BYTES * 0.9
+            for _, size, path in files:
+                if total <= target:
+                    break
+                try:
+                    os.remove(path)
+                    total -= size
+                    metric_inc("cache_evictions", tier="l2")
+                except OSError:
+                    pass
+
+    # ----- 공개 API -----
+    def get(self, ns: str, key: str, default=None):
+        full = f"{CACHE_NAMESPACE}:{ns}:{key}"
+        e = self._l1_get(full)
+        if e is not None:
+            metric_inc("cache", ns=ns, result="l1_hit")
+            return e[2]
+        blob = self._l2_get(full)
+        if blob is not None:
+            try:
+                value = json.loads(blob)
+            except ValueError:
+                # 깨진 항목은 미스로 처리하고 지워서 다음 요청이 다시 채우게 함
+                metric_inc("cache", ns=ns, result="corrupt")
+                self._l2_delete(full)
+                value = None
+            if value is not None:
+                metric_inc("cache", ns=ns, result="l2_hit")
+                self._l1_put(full, value, len(blob), 0)
+                return value
+        metric_inc("cache", ns=ns, result="miss")
+        return default
+
+    def set(self, ns: str, key: str, value, ttl: float = None):
+        full = f"{CACHE_NAMESPACE}:{ns}:{key}"
+        blob = json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        self._l1_put(full, value, len(blob), time.time() + ttl if ttl else 0)
+        try:
+            self._l2_set(full, blob, ttl)
+        except OSError as e:
+            print("❗ 공유 캐시 저장 실패:", e, flush=True)
+
+    def delete(self, ns: str, key: str):
+        full = f"{CACHE_NAMESPACE}:{ns}:{key}"
+        with self._lock:
+            self._l1_drop(full)
+        self._l2_delete(full)
+
+    def get_or_set(self, ns: str, key: str, fn, ttl: float = None):
+        value = self.get(ns, key)
+        if value is None:
+            value = fn()
+            if value is not None:
+                self.set(ns, key, value, ttl)
+        return value
+
+    def stats(self) -> dict:
+        with self._lock:
+            l1 = {"entries": len(self._l1), "bytes": self._l1_bytes, "max_bytes": CACHE_L1_BYTES}
+        l2 = {"backend": self.backend}
+        if self.backend == "file":
+            sizes = [e.stat().st_size for e in os.scandir(CACHE_DIR)
+                     if not e.name.startswith(".") and not e.name.endswith(".tmp")]
+            l2.update(dir=CACHE_DIR, entries=len(sizes), bytes=sum(sizes), max_bytes=CACHE_L2_BYTES)
+        with _metrics_lock:
+            counters = {k: v for k, v in _metrics_counters.items() if k.startswith("cache")}
+        return {"pid": os.getpid(), "l1": l1, "l2": l2, "counters": counters}
+
+shared_cache = SharedCache(CACHE_BACKEND)
+
+# ---------------------------------------------------------------------
+# 🔁 Single-flight: 동일한 LLM 요청이 진행 중이면 결과를 공유
+#   - 워커 내부: key별 진행 중 호출을 기다렸다가 같은 결과 사용
+#   - SINGLEFLIGHT_DIR 설정 시 워커 간에도 공유
+#     (key별 lock 파일을 flock으로 잡은 워커만 호출, 결과는 파일로 전달)
+# ---------------------------------------------------------------------
+SINGLEFLIGHT_DIR = os.environ.get("SINGLEFLIGHT_DIR", "")
+SINGLEFLIGHT_WAIT_SEC = float(os.environ.get("SINGLEFLIGHT_WAIT_SEC", "120"))
+SINGLEFLIGHT_RESULT_TTL_SEC = 600
+
+_inflight_lock = threading.Lock()
+_inflight = {}
+
+class _Flight:
+    __slots__ = ("event", "result", "error")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+def prompt_hash(endpoint: str, messages, kwargs=None) -> str:
+    """엔드포인트 + 메시지 + 호출 옵션을 정규화한 JSON의 sha256"""
+    canon = json.dumps([endpoint, messages, kwargs or {}], sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(canon.encode("utf-8")).hexdigest()
+
+def singleflight(key: str, fn, endpoint: str = ""):
+    """
+    key가 같은 호출이 진행 중이면 기다렸다가 그 결과(또는 예외)를 그대로 돌려줌
+    fn의 반환값은 JSON 직렬화 가능해야 함 (워커 간 공유 시 파일로 전달)
+    """
+    with _inflight_lock:
+        flight = _inflight.get(key)
+        leader = flight is None
+        if leader:
+            flight = _inflight[key] = _Flight()
+
+    if not leader:
+        # 앞선 스레드가 멈추거나 죽어도 무한정 기다리지 않음 → 시간 초과 시 직접 호출
+        if not flight.event.wait(SINGLEFLIGHT_WAIT_SEC):
+            metric_inc("singleflight_wait_timeout", endpoint=endpoint)
+            return fn()
+        metric_inc("singleflight_shared", endpoint=endpoint, scope="worker")
+        if flight.error is not None:
+            raise flight.error
+        return flight.result
+
+    try:
+        if SINGLEFLIGHT_DIR and fcntl:
+            flight.result = _singleflight_shared(key, fn, endpoint)
+        else:
+            flight.result = fn()
+        return flight.result
+    except Exception as e:
+        flight.error = e
+        raise
+    finally:
+        with _inflight_lock:
+            _inflight.pop(key, None)
+        flight.event.set()
+
+def _singleflight_lock(lock_path: str, deadline: float):
+    """
+    lock 파일 배타 잠금 → (fd, 기다렸는지). deadline 까지 못 잡으면 (None, True)
+    - 잡은 뒤 경로의 inode 가 바뀌었으면(정리로 삭제 후 재생성) 새 파일로 다시 시도
+      → 지워진 inode 를 잡은 워커와 새 파일을 잡은 워커가 동시에 호출하는 일이 없음
+    """
+    waited = False
+    while True:
+        fd = os.open(lock_path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            while True:
+                try:
+                    fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    break
+                except BlockingIOError:
+                    waited = True
+                    if time.time() >= deadline:
+                        os.close(fd)
+                        return None, waited
+                    time.sleep(0.05)
+            try:
+                same = os.fstat(fd).st_ino == os.stat(lock_path).st_ino
+            except FileNotFoundError:
+                same = False
+        except BaseException:
+            os.close(fd)
+            raise
+        if same:
+            return fd, waited
+        os.close(fd)
+
+def _singleflight_shared(key: str, fn, endpoint: str):
+    """워커 간 single-flight: lock 파일을 잡은 워커가 호출하고 결과 파일을 남김"""
+    os.makedirs(SINGLEFLIGHT_DIR, exist_ok=True)
+    lock_path = os.path.join(SINGLEFLIGHT_DIR, f"{key}.lock")
+    result_path = os.path.join(SINGLEFLIGHT_DIR, f"{key}.json")
+    arrived = time.time()
+
+    # 다른 워커가 호출 중이면 끝날 때까지(최대 SINGLEFLIGHT_WAIT_SEC) 대기
+    fd, waited = _singleflight_lock(lock_path, arrived + SINGLEFLIGHT_WAIT_SEC)
+    if fd is None:
+        return fn()
+    try:
+        if waited:
+            try:
+                if os.path.getmtime(result_path) >= arrived:
+                    with open(result_path, encoding="utf-8") as f:
+                        metric_inc("singleflight_shared", endpoint=endpoint, scope="cross-worker")
+                        return json.load(f)["v"]
+            except (OSError, ValueError, KeyError):
+                pass
+            # 앞선 워커가 실패했으면 직접 호출 (lock은 잡은 상태라 뒤따르는 워커는 이 결과를 기다림)
+
+        result = fn()
+        tmp = f"{result_path}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"v": result}, f, ensure_ascii=False)
+        os.replace(tmp, result_path)
+        if random.random() < 0.02:
+            _singleflight_prune()
+        return result
+    finally:
+        fcntl.flock(fd, fcntl.LOCK_UN)
+        os.close(fd)
+
+def _singleflight_prune():
+    """
+    오래된 결과/lock 파일 정리
+    - lock 파일은 비차단 flock 을 잡을 수 있을 때만 삭제 (호출 중인 lock 은 그대로)
+    - 임시 파일은 다른 워커가 막 os.replace 하려는 중일 수 있으므로 충분히 오래된 것만
+    """
+    now = time.time()
+    cutoff = now - SINGLEFLIGHT_RESULT_TTL_SEC
+    tmp_cutoff = now - max(SINGLEFLIGHT_RESULT_TTL_SEC, 60)
+    try:
+        names = os.listdir(SINGLEFLIGHT_DIR)
+    except OSError:
+        return
+    for name in names:
+        path = os.path.join(SINGLEFLIGHT_DIR, name)
+        try:
+            if os.path.getmtime(path) >= (tmp_cutoff if name.endswith(".tmp") else cutoff):
+                continue
+            if not name.endswith(".lock"):
+                os.remove(path)
+                continue
+            fd = os.open(path, os.O_RDWR)
+            try:
+                try:
+                    fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    continue
+                os.remove(path)
+            finally:
+                os.close(fd)
+        except OSError:
+            pass
+
+# ---------------------------------------------------------------------
+# 🤖 LLM 호출: 단계별(tiered) 모델 + 헤지(hedged) 요청
+#   - LLM_<ENDPOINT>_MODELS : 시도할 모델 순서 (예: "gpt-4.1-mini,gpt-4-turbo")
+#     앞 모델 응답이 검증(validate)을 통과하지 못하면 다음 모델로 승격
+#   - LLM_<ENDPOINT>_HEDGE  : "0"(끔) | "p95"(관측 p95 후) | 초 단위 숫자
+#     첫 요청이 그 시간 안에 안 끝나면 같은 요청을 하나 더 보내고 먼저 끝난 쪽 사용
+# ---------------------------------------------------------------------
+LLM_DEFAULT_MODEL = "gpt-4-turbo"
+LLM_HEDGE_MIN_SEC = 2.0   # p95 관측값이 부족하거나 너무 짧을 때의 하한
+
+_llm_pool = concurrent.futures.ThreadPoolExecutor(
+    max_workers=int(os.environ.get("LLM_POOL_SIZE", "16")),
+    thread_name_prefix="llm",
+)
+
+def _llm_config(endpoint: str):
+    env = endpoint.upper()
+    models = [
+        m.strip() for m in os.environ.get(f"LLM_{env}_MODELS", LLM_DEFAULT_MODEL).split(",")
+        if m.strip()
+    ] or [LLM_DEFAULT_MODEL]
+    hedge = os.environ.get(f"LLM_{env}_HEDGE", "0").strip().lower()
+    return models, hedge
+
+def _hedge_delay(endpoint: str, model: str, hedge: str):
+    """헤지 요청을 보낼 대기 시간(초). None이면 헤지 안 함."""
+    if hedge in ("", "0", "off", "false") or LLM_REPLAY_MODE == "replay":
+        return None
+    if hedge == "p95":
+        p95 = metric_quantile("llm_latency_sec", 0.95, endpoint=endpoint, model=model)
+        return max(LLM_HEDGE_MIN_SEC, p95) if p95 is not None else None
+    try:
+        return max(0.0, float(hedge))
+    except ValueError:
+        return None
+
+def _usage_dict(usage) -> dict:
+    """응답 usage → 프롬프트/캐시/완성 토큰 수와 캐시 적중 비율"""
+    prompt_tokens = int(getattr(usage, "prompt_tokens", 0) or 0)
+    details = getattr(usage, "prompt_tokens_details", None)
+    cached = int(getattr(details, "cached_tokens", 0) or 0)
+    return {
+        "prompt_tokens": prompt_tokens,
+        "cached_tokens": cached,
+        "completion_tokens": int(getattr(usage, "completion_tokens", 0) or 0),
+        "cached_ratio": round(cached / prompt_tokens, 3) if prompt_tokens else 0.0,
+    }
+
+# ---------- LLM 기록/재생 ----------
+#   record: 요청/응답/소요 시간을 LLM_REPLAY_DIR/calls_<pid>.jsonl.gz 에 한 줄씩 추가
+#   replay: 같은 prompt_hash 의 기록을 기록된 순서대로 돌려줌 (지연 = 원래 시간 × 배율)
+#           기록이 없으면 LLMReplayMiss — 네트워크로 새지 않음
+class LLMReplayMiss(RuntimeError):
+    pass
+
+_replay_lock = threading.Lock()
+_replay_index = None   # key → [entry, ...]
+_replay_cursor = collections.Counter()
+
+def _compact_request(obj):
+    """기록용 요청 사본: base64 이미지 등 큰 data URL 은 해시로 대체"""
+    if isinstance(obj, dict):
+        return {k: _compact_request(v) for k, v in obj.items()}
+    if isinstance(obj, list):
+        return [_compact_request(v) for v in obj]
+    if isinstance(obj, str) and obj.startswith("data:") and len(obj) > 256:
+        return f"<{obj[:obj.find(',')]} {len(obj)}B sha256:{hashlib.sha256(obj.encode()).hexdigest()[:16]}>"
+    return obj
+
+def _load_replay_index():
+    index = collections.defaultdict(list)
+    for path in sorted(glob.glob(os.path.join(LLM_REPLAY_DIR, "*.jsonl.gz"))):
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    entry = json.loads(line)
+                    index[entry["key"]].append(entry)
+    for entries in index.values():
+        entries.sort(key=lambda e: e.get("ts", 0))
+    print(f"🎞️ LLM 재생 기록 {sum(len(v) for v in index.values())}건 로드 ({LLM_REPLAY_DIR})", flush=True)
+    return index
+
+def _replay_next(key: str):
+    """같은 key 가 여러 번 기록됐으면 기록 순서대로 돌아가며 반환 (결정적)"""
+    global _replay_index
+    with _replay_lock:
+        if _replay_index is None:
+            _replay_index = _load_replay_index()
+        entries = _replay_index.get(key)
+        if not entries:
+            return None
+        i = _replay_cursor[key]
+        _replay_cursor[key] += 1
+        return entries[i % len(entries)]
+
+def _record_append(entry: dict):
+    line = json.dumps(entry, ensure_ascii=False, separators=(",", ":")) + "\n"
+    os.makedirs(LLM_REPLAY_DIR, exist_ok=True)
+    path = os.path.join(LLM_REPLAY_DIR, f"calls_{os.getpid()}.jsonl.gz")
+    with _replay_lock:
+        # gzip 멤버를 이어 붙이는 방식 (읽을 때 하나의 스트림으로 이어서 읽힘)
+        with gzip.open(path, "at", encoding="utf-8") as f:
+            f.write(line)
+
+def llm_record_replay(endpoint: str, request_obj: dict, call):
+    """
+    LLM 호출 래퍼. call() 은 JSON 직렬화 가능한 응답을 반환해야 함.
+    LLM_REPLAY_MODE 가 비어 있으면 call() 을 그대로 실행.
+    """
+    if not LLM_REPLAY_MODE:
+        return call()
+    key = prompt_hash(endpoint, request_obj)
+    if LLM_REPLAY_MODE == "replay":
+        entry = _replay_next(key)
+        if entry is None:
+            metric_inc("llm_replay_miss", endpoint=endpoint)
+            raise LLMReplayMiss(f"기록된 응답이 없습니다 ({endpoint} {key[:12]})")
+        delay = entry.get("latency", 0) * LLM_REPLAY_LATENCY_SCALE
+        if delay > 0:
+            time.sleep(delay)
+        return entry["response"]
+    t0 = time.perf_counter()
+    response = call()
+    if LLM_REPLAY_MODE == "record":
+        _record_append({
+            "key": key,
+            "endpoint": endpoint,
+            "ts": time.time(),
+            "latency": round(time.perf_counter() - t0, 4),
+            "request": _compact_request(request_obj),
+            "response": response,
+        })
+    return response
+
+def _chat_completion(model: str, kwargs: dict) -> dict:
+    res = client.chat.completions.create(model=model, **kwargs)
+    return {"content": res.choices[0].message.content or "", "usage": _usage_dict(getattr(res, "usage", None))}
+
+def _timed_completion(endpoint: str, model: str, kwargs: dict):
+    """모델 1회 호출 → (content, usage)"""
+    t0 = time.perf_counter()
+    try:
+        out = llm_record_replay(endpoint, {"model": model, **kwargs}, lambda: _chat_completion(model, kwargs))
+    except Exception:
+        metric_inc("llm_calls", endpoint=endpoint, model=model, outcome="error")
+        raise
+    metric_observe("llm_latency_sec", time.perf_counter() - t0, endpoint=endpoint, model=model)
+    metric_inc("llm_calls", endpoint=endpoint, model=model, outcome="ok")
+    usage = out["usage"]
+    metric_observe("llm_prompt_tokens", usage["prompt_tokens"], endpoint=endpoint, model=model)
+    metric_observe("llm_cached_ratio", usage["cached_ratio"], endpoint=endpoint, model=model)
+    return out["content"], usage
+
+def _hedged_completion(endpoint: str, model: str, kwargs: dict, delay):
+    """delay 초 안에 첫 요청이 안 끝나면 두 번째 요청을 보내고, 먼저 성공한 응답을 반환"""
+    if delay is None:
+        return _timed_completion(endpoint, model, kwargs)
+
+    first = _llm_pool.submit(_timed_completion, endpoint, model, kwargs)
+    done, _ = concurrent.futures.wait([first], timeout=delay)
+    if done:
+        return first.result()
+
+    metric_inc("llm_hedges", endpoint=endpoint, model=model)
+    second = _llm_pool.submit(_timed_completion, endpoint, model, kwargs)
+    pending = {first, second}
+    last_error = None
+    while pending:
+        done, pending = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+        for f in done:
+            if f.exception() is None:
+                if f is second:
+                    metric_inc("llm_hedge_wins", endpoint=endpoint, model=model)
+                # 진 쪽 요청은 취소할 수 없으므로 끝나면 버려짐
+                return f.result()
+            last_error = f.exception()
+    raise last_error
+
+def llm_chat(endpoint: str, messages, validate=None, **kwargs):
+    """
+    엔드포인트 설정에 따라 모델을 단계적으로 시도하여 (content, model, usage) 반환
+    - validate(content) -> bool : 통과 못 하면 다음 모델로 승격 (마지막 모델은 그대로 반환)
+    - 같은 프롬프트 요청이 진행 중이면 새로 보내지 않고 그 결과를 공유 (single-flight)
+    """
+    key = prompt_hash(endpoint, messages, kwargs)
+    with profile_stage(f"llm:{endpoint}"):
+        content, model, usage = singleflight(
+            key, lambda: list(_llm_chat_tiered(endpoint, messages, validate, **kwargs)), endpoint=endpoint
+        )
+    return content, model, usage
+
+def _llm_chat_tiered(endpoint: str, messages, validate=None, **kwargs):
+    models, hedge = _llm_config(endpoint)
+    t0 = time.perf_counter()
+    for i, model in enumerate(models):
+        last = i == len(models) - 1
+        try:
+            content, usage = _hedged_completion(endpoint, model, {"messages": messages, **kwargs},
+                                                _hedge_delay(endpoint, model, hedge))
+        except Exception:
+            if last:
+                raise
+            metric_inc("llm_escalations", endpoint=endpoint, model=model, reason="error")
+            continue
+        if last or validate is None or validate(content):
+            metric_observe("llm_total_sec", time.perf_counter() - t0, endpoint=endpoint)
+            metric_inc("llm_served", endpoint=endpoint, model=model)
+            return content, model, usage
+        metric_inc("llm_escalations", endpoint=endpoint, model=model, reason="invalid")
 
 # ---------- JSON parse helper (safe) ----------
 def parse_json_safely(s: str):
@@ -109,10 +982,52 @@ def parse_json_safely(s: str):
 # DB
 # ---------------------------------------------------------------------
 DATABASE_URL = os.environ.get("DATABASE_URL")
-if DATABASE_URL:
+
+# SQLite 동시성 튜닝 (여러 워커가 동시에 쓰면 "database is locked" 방지)
+SQLITE_BUSY_TIMEOUT_MS = int(os.environ.get("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+SQLITE_SYNCHRONOUS = os.environ.get("SQLITE_SYNCHRONOUS", "NORMAL").upper()
+SQLITE_POOL_SIZE = int(os.environ.get("SQLITE_POOL_SIZE", "10"))
+SQLITE_MAX_OVERFLOW = int(os.environ.get("SQLITE_MAX_OVERFLOW", "20"))
+
+def _is_sqlite_url(url) -> bool:
+    return bool(url) and url.startswith("sqlite")
+
+def _create_sqlite_engine(url: str):
+    """
+    SQLite 전용 엔진
+    - 파일 DB 는 기본 QueuePool: 세션마다 커넥션을 빌려 쓰고 반납 (스레드 간 공유 없음)
+    - 커넥션 생성 시 PRAGMA 적용: WAL 저널, busy timeout, synchronous
+    """
+    pool_args = {}
+    if ":memory:" not in url and url not in ("sqlite://", "sqlite:///"):
+        pool_args = {"pool_size": SQLITE_POOL_SIZE, "max_overflow": SQLITE_MAX_OVERFLOW}
+    eng = create_engine(
+        url,
+        connect_args={
+            "check_same_thread": False,
+            "timeout": SQLITE_BUSY_TIMEOUT_MS / 1000.0,
+        },
+        **pool_args,
+    )
+
+    @event.listens_for(eng, "connect")
+    def _sqlite_on_connect(dbapi_conn, _record):
+        cur = dbapi_conn.cursor()
+        try:
+            # WAL: 읽기는 쓰기를 막지 않고, 쓰기는 읽기를 막지 않음
+            cur.execute("PRAGMA journal_mode=WAL")
+            cur.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+            if SQLITE_SYNCHRONOUS in ("OFF", "NORMAL", "FULL", "EXTRA"):
+                cur.execute(f"PRAGMA synchronous={SQLITE_SYNCHRONOUS}")
+        finally:
+            cur.close()
+
+    return eng
+
+if DATABASE_URL and not _is_sqlite_url(DATABASE_URL):
     engine = create_engine(DATABASE_URL, pool_pre_ping=True)
 else:
-    engine = create_engine("sqlite:///app.db", connect_args={"check_same_thread": False})
+    engine = _create_sqlite_engine(DATABASE_URL or "sqlite:///app.db")
 
 SessionLocal = sessionmaker(bind=engine, autocommit=False, autoflush=False)
 Base = declarative_base()
@@ -143,20 +1058,575 @@ class Report(Base):
 
 Base.metadata.create_all(engine)
 
+# ---------------------------------------------------------------------
+# 🔎 Report 전문 검색 인덱스
+#   - SQLite: FTS5 가상 테이블 (rowid = report id)
+#   - Postgres: tsvector + GIN 인덱스 보조 테이블
+#   - FTS5를 못 쓰는 SQLite 빌드면 LIKE 검색으로 대체
+# ---------------------------------------------------------------------
+SEARCH_BACKEND = None  # "fts5" | "tsvector" | None(LIKE)
+
+def _create_search_index(conn):
+    """DB 종류에 맞는 검색 인덱스 테이블 생성. 사용할 backend 이름을 반환."""
+    dialect = conn.dialect.name
+    if dialect == "sqlite":
+        conn.execute(text(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS reports_fts "
+            "USING fts5(student, question, essay, summary, tokenize='unicode61')"
+        ))
+        return "fts5"
+    if dialect == "postgresql":
+        conn.execute(text(
+            "CREATE TABLE IF NOT EXISTS report_search ("
+            " report_id INTEGER PRIMARY KEY REFERENCES reports(id) ON DELETE CASCADE,"
+            " tsv TSVECTOR NOT NULL)"
+        ))
+        conn.execute(text(
+            "CREATE INDEX IF NOT EXISTS ix_report_search_tsv "
+            "ON report_search USING GIN (tsv)"
+        ))
+        return "tsvector"
+    return None
+
+def _init_search_index():
+    global SEARCH_BACKEND
+    try:
+        with engine.begin() as conn:
+            SEARCH_BACKEND = _create_search_index(conn)
+    except Exception as e:
+        print("❗ 검색 인덱스 초기화 실패 (LIKE 검색으로 대체):", e, flush=True)
+        SEARCH_BACKEND = None
+
+_init_search_index()
+
+def _search_fields(payload: dict):
+    """검색 대상 필드: 학생 이름, 질문, 논술문, 총평"""
+    p = payload if isinstance(payload, dict) else {}
+    return {
+        "student": _s(p.get("student") or p.get("name")),
+        "question": _s(p.get("question")),
+        "essay": _s(p.get("essay")),
+        "summary": _s(p.get("summary")),
+    }
+
+def _search_index_report(conn, report_id: int, payload: dict):
+    """리포트 1건을 검색 인덱스에 반영 (같은 id면 교체)."""
+    f = _search_fields(payload)
+    if SEARCH_BACKEND == "fts5":
+        conn.execute(text("DELETE FROM reports_fts WHERE rowid = :id"), {"id": report_id})
+        conn.execute(text(
+            "INSERT INTO reports_fts(rowid, student, question, essay, summary) "
+            "VALUES (:id, :student, :question, :essay, :summary)"
+        ), {"id": report_id, **f})
+    elif SEARCH_BACKEND == "tsvector":
+        conn.execute(text(
+            "INSERT INTO report_search(report_id, tsv) VALUES (:id, "
+            " setweight(to_tsvector('simple', :student), 'A') ||"
+            " setweight(to_tsvector('simple', :question), 'B') ||"
+            " setweight(to_tsvector('simple', :summary), 'B') ||"
+            " setweight(to_tsvector('simple', :essay), 'C')) "
+            "ON CONFLICT (report_id) DO UPDATE SET tsv = EXCLUDED.tsv"
+        ), {"id": report_id, **f})
+
+def _search_terms(q: str):
+    """검색어에서 단어만 추출 (따옴표/연산자 등은 제거해 쿼리 문법 오류 방지)"""
+    return re.findall(r"\w+", q or "")[:10]
+
+def search_report_ids(db, q: str, user_id=None, limit: int = 50):
+    """검색어에 맞는 report id 목록 (관련도순). 모든 단어가 접두어로 일치해야 함."""
+    terms = _search_terms(q)
+    if not terms:
+        return []
+    params = {"limit": limit}
+    user_clause = ""
+    if user_id is not None:
+        user_clause = " AND r.user_id = :uid"
+        params["uid"] = user_id
+
+    if SEARCH_BACKEND == "fts5":
+        params["q"] = " ".join(f'"{t}"*' for t in terms)
+        sql = (
+            "SELECT r.id FROM reports_fts f JOIN reports r ON r.id = f.rowid "
+            "WHERE reports_fts MATCH :q" + user_clause +
+            " ORDER BY bm25(reports_fts, 10.0, 5.0, 1.0, 5.0) LIMIT :limit"
+        )
+    elif SEARCH_BACKEND == "tsvector":
+        params["q"] = " & ".join(f"{t}:*" for t in terms)
+        sql = (
+            "SELECT r.id FROM report_search s JOIN reports r ON r.id = s.report_id "
+            "WHERE s.tsv @@ to_tsquery('simple', :q)" + user_clause +
+            " ORDER BY ts_rank(s.tsv, to_tsquery('simple', :q)) DESC, r.id DESC LIMIT :limit"
+        )
+    else:
+        conds = []
+        for i, t in enumerate(terms):
+            params[f"t{i}"] = f"%{t}%"
+            conds.append(f"r.payload_json LIKE :t{i}")
+        sql = (
+            "SELECT r.id FROM reports r WHERE " + " AND ".join(conds) + user_clause +
+            " ORDER BY r.created_at DESC LIMIT :limit"
+        )
+    return [row[0] for row in db.execute(text(sql), params)]
+
+def backfill_search_index(batch_size: int = 1000) -> int:
+    """기존 리포트 전체를 id 순서로 배치 색인. 색인한 건수를 반환."""
+    if SEARCH_BACKEND is None:
+        return 0
+    done = 0
+    last_id = 0
+    while True:
+        with engine.begin() as conn:
+            rows = conn.execute(text(
+                "SELECT id, payload_json FROM reports WHERE id > :last ORDER BY id LIMIT :n"
+            ), {"last": last_id, "n": batch_size}).fetchall()
+            if not rows:
+                break
+            for rid, payload_json in rows:
+                try:
+                    p = json.loads(payload_json)
+                except Exception:
+                    p = {}
+                _search_index_report(conn, rid, p)
+            last_id = rows[-1][0]
+            done += len(rows)
+    return done
+
+@app.cli.command("search-backfill")
+def search_backfill_command():
+    """flask --app app search-backfill : 기존 리포트 검색 인덱스 재구축"""
+    n = backfill_search_index()
+    print(f"✅ 검색 인덱스 색인 완료: {n}건 (backend={SEARCH_BACKEND or 'like'})", flush=True)
+
+_BENCH_WORDS = (
+    "사회 개인 자유 책임 공동체 정의 평등 선택 가치 행복 권리 의무 도덕 법 제도 시장 국가 환경 기술 "
+    "교육 문화 전통 변화 갈등 합의 이익 손해 비용 효율 공정 분배 성장 발전 위험 안전 신뢰 협력 경쟁 "
+    "다양성 관용 차별 소수 다수 민주주의 참여 표현 언론 정보 사생활 감시 인공지능 노동 일자리 복지 세금 "
+    "인구 고령화 도시 농촌 기후 에너지 소비 생산 윤리 과학 예술 역사 미래 세대 청소년 가족 공감 이성 감정"
+).split()
+
+_BENCH_PARTICLES = ["", "", "은", "는", "이", "가", "을", "를", "의", "에", "에서", "으로", "와", "도"]
+
+def _bench_payload(rnd: random.Random, words: list, weights: list):
+    """
+    search-bench 용 합성 리포트 payload
+    - 단어 빈도는 지프 분포, 조사를 붙여 실제 글처럼 토큰이 갈라지게 함 (사회는/사회를 ...)
+    """
+    def sentence(k):
+        return " ".join(w + rnd.choice(_BENCH_PARTICLES) for w in rnd.choices(words, weights, k=k))
+    return {
+        "student": f"학생{rnd.randint(1, 5000)}",
+        "question": sentence(12),
+        "essay": sentence(rnd.randint(150, 400)),
+        "summary": sentence(20),
+        "scores": [rnd.randint(3, 10) for _ in range(4)],
+    }
+
+@app.cli.command("search-bench")
+@click.option("--url", "db_url", default="", help="벤치용 DB URL (기본: 임시 SQLite 파일). reports 가 비어 있는 DB 만 허용")
+@click.option("--rows", default=100000, help="합성 리포트 수")
+@click.option("--queries", default=50, help="질의 유형별 실행 횟수")
+@click.option("--users", default=200, help="리포트를 나눠 가질 사용자 수")
+def search_bench_command(db_url, rows, queries, users):
+    """flask --app app search-bench : 합성 리포트로 backend 별 search_report_ids 지연시간 측정"""
+    global SEARCH_BACKEND
+
+    tmp_dir = None
+    if not db_url:
+        tmp_dir = tempfile.mkdtemp(prefix="search_bench_")
+        db_url = f"sqlite:///{os.path.join(tmp_dir, 'bench.db')}"
+    eng = _create_sqlite_engine(db_url) if db_url.startswith("sqlite") else create_engine(db_url)
+    Base.metadata.create_all(eng, tables=[Report.__table__])
+    Session = sessionmaker(bind=eng, autocommit=False, autoflush=False)
+    saved_backend = SEARCH_BACKEND
+
+    try:
+        with eng.begin() as conn:
+            if conn.execute(text("SELECT COUNT(*) FROM reports")).scalar():
+                print("❗ reports 테이블이 비어 있지 않습니다. 빈 벤치용 DB 를 지정하세요.", flush=True)
+                return
+            indexed = _create_search_index(conn)
+
+        rnd = random.Random(42)
+        words = list(_BENCH_WORDS)
+        weights = [1.0 / (i + 1) for i in range(len(words))]
+
+        # 1) 리포트 적재 + 검색 인덱스 색인 (실제 색인 경로인 _search_index_report 사용)
+        SEARCH_BACKEND = indexed
+        t0 = time.perf_counter()
+        for start in range(0, rows, 5000):
+            batch = [(start + i + 1, _bench_payload(rnd, words, weights)) for i in range(min(5000, rows - start))]
+            with eng.begin() as conn:
+                conn.execute(
+                    text("INSERT INTO reports (id, user_id, payload_json, created_at) VALUES (:id, :uid, :p, :ts)"),
+                    [
+                        {"id": rid, "uid": rid % users + 1, "p": json.dumps(p, ensure_ascii=False),
+                         "ts": datetime.utcnow() - timedelta(minutes=rows - rid)}
+                        for rid, p in batch
+                    ],
+                )
+                for rid, p in batch:
+                    _search_index_report(conn, rid, p)
+        print(f"적재: {rows}건, {time.perf_counter() - t0:.1f}s (색인 backend={indexed or 'like'})", flush=True)
+
+        # 2) 질의 유형: 흔한 단어 / 드문 단어 / 두 단어 / 접두어 / 학생 이름 / 사용자 한정
+        kinds = {
+            "common": lambda: (rnd.choice(words[:5]), None),
+            "rare": lambda: (rnd.choice(words[-10:]), None),
+            "two-terms": lambda: (" ".join(rnd.sample(words[:30], 2)), None),
+            "prefix": lambda: (rnd.choice(words)[:2], None),
+            "student": lambda: (f"학생{rnd.randint(1, 5000)}", None),
+            "per-user": lambda: (rnd.choice(words[:30]), rnd.randint(1, users)),
+        }
+        backends = ([indexed] if indexed else []) + [None]
+        for backend in backends:
+            SEARCH_BACKEND = backend
+            for kind, make in kinds.items():
+                lat, hits = [], 0
+                db = Session()
+                try:
+                    for _ in range(queries):
+                        q, uid = make()
+                        t0 = time.perf_counter()
+                        ids = search_report_ids(db, q, user_id=uid, limit=50)
+                        lat.append(time.perf_counter() - t0)
+                        hits += len(ids)
+                finally:
+                    db.close()
+                a = np.array(lat)
+                print(
+                    f"{backend or 'like':8s} {kind:10s}: p50 {np.quantile(a, 0.5) * 1000:7.1f} ms, "
+                    f"p95 {np.quantile(a, 0.95) * 1000:7.1f} ms, p99 {np.quantile(a, 0.99) * 1000:7.1f} ms, "
+                    f"평균 결과 {hits / queries:.1f}건",
+                    flush=True,
+                )
+    finally:
+        SEARCH_BACKEND = saved_backend
+        eng.dispose()
+        if tmp_dir:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+# ---------------------------------------------------------------------
+# 📈 점수 롤업 (리포트 1건 = 1행, 4개 기준 점수를 컬럼으로 펼쳐 저장)
+#   payload_json을 매번 파싱하지 않고 바로 집계할 수 있게 함
+# ---------------------------------------------------------------------
+class ScoreRollup(Base):
+    __tablename__ = "report_scores"
+    report_id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, nullable=True, index=True)
+    student = Column(String(120), nullable=False, default="")
+    logic = Column(Integer, nullable=False)       # 논리력
+    reading = Column(Integer, nullable=False)     # 독해력
+    structure = Column(Integer, nullable=False)   # 구성력
+    expression = Column(Integer, nullable=False)  # 표현력
+    total = Column(Integer, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
+
+    __table_args__ = (
+        Index("ix_report_scores_user_student_created", "user_id", "student", "created_at"),
+    )
+
+SCORE_COLUMNS = ["logic", "reading", "structure", "expression"]  # CRITERIA_KEYS 순서
+
+Base.metadata.create_all(engine, tables=[ScoreRollup.__table__])
+
+def _extract_scores(payload: dict):
+    """payload의 scores를 0~10 정수 4개로 정규화. 형식이 안 맞으면 None."""
+    scores = payload.get("scores") if isinstance(payload, dict) else None
+    if not isinstance(scores, list) or len(scores) != 4:
+        return None
+    try:
+        return [max(0, min(10, int(x))) for x in scores]
+    except Exception:
+        return None
+
+def _rollup_report(db, report: Report, payload: dict):
+    """리포트 1건의 점수를 롤업 테이블에 반영 (같은 report_id면 덮어씀)."""
+    scores = _extract_scores(payload)
+    if scores is None:
+        return
+    db.merge(ScoreRollup(
+        report_id=report.id,
+        user_id=report.user_id,
+        student=_s(payload.get("student") or payload.get("name"))[:120],
+        logic=scores[0],
+        reading=scores[1],
+        structure=scores[2],
+        expression=scores[3],
+        total=sum(scores),
+        created_at=report.created_at,
+    ))
+
+def backfill_score_rollup(batch_size: int = 1000) -> int:
+    """기존 리포트 전체를 롤업 테이블에 반영. 반영한 건수를 반환."""
+    done = 0
+    last_id = 0
+    while True:
+        db = SessionLocal()
+        try:
+            rows = (
+                db.query(Report)
+                .filter(Report.id > last_id)
+                .order_by(Report.id)
+                .limit(batch_size)
+                .all()
+            )
+            if not rows:
+                break
+            for r in rows:
+                try:
+                    p = json.loads(r.payload_json)
+                except Exception:
+                    p = {}
+                if _extract_scores(p) is not None:
+                    _rollup_report(db, r, p)
+                    done += 1
+            db.commit()
+            last_id = rows[-1].id
+        finally:
+            db.close()
+    return done
+
+@app.cli.command("analytics-backfill")
+def analytics_backfill_command():
+    """flask --app app analytics-backfill : 기존 리포트 점수 롤업 재구축"""
+    n = backfill_score_rollup()
+    print(f"✅ 점수 롤업 완료: {n}건", flush=True)
+
+def _load_score_matrix(db, user_id=None, student=None, date_from=None, date_to=None):
+    """
+    롤업 테이블에서 범위 조회 → (students, created_at, scores[n,4]) numpy 배열
+    """
+    q = db.query(
+        ScoreRollup.student, ScoreRollup.created_at,
+        ScoreRollup.logic, ScoreRollup.reading,
+        ScoreRollup.structure, ScoreRollup.expression,
+    )
+    if user_id is not None:
+        q = q.filter(ScoreRollup.user_id == user_id)
+    if student is not None:
+        q = q.filter(ScoreRollup.student == student)
+    if date_from is not None:
+        q = q.filter(ScoreRollup.created_at >= date_from)
+    if date_to is not None:
+        q = q.filter(ScoreRollup.created_at < date_to)
+    rows = q.order_by(ScoreRollup.created_at).all()
+
+    students = np.array([r[0] for r in rows], dtype=object)
+    created = [r[1] for r in rows]
+    scores = np.array([r[2:] for r in rows], dtype=np.int16).reshape(-1, 4)
+    return students, created, scores
+
+def _criteria_stats(scores: np.ndarray) -> dict:
+    """기준별 평균/표준편차/최소/최대 (scores: [n,4])"""
+    if scores.shape[0] == 0:
+        return {k: None for k in CRITERIA_KEYS}
+    mean = scores.mean(axis=0)
+    std = scores.std(axis=0)
+    mn = scores.min(axis=0)
+    mx = scores.max(axis=0)
+    return {
+        k: {
+            "mean": round(float(mean[i]), 2),
+            "std": round(float(std[i]), 2),
+            "min": int(mn[i]),
+            "max": int(mx[i]),
+        }
+        for i, k in enumerate(CRITERIA_KEYS)
+    }
+
+# ---------------------------------------------------------------------
+# 🪞 유사(복사) 논술문 탐지: 문자 n-gram MinHash + LSH
+#   - 공백/문장부호를 지운 한글 문자 3-gram을 shingle로 사용
+#   - 서명(128개 해시)을 16밴드 × 8행으로 나눠 버킷 테이블에 저장
+#   - 조회는 (band, bucket) 인덱스로 후보만 뽑고 서명으로 유사도 추정
+#     → 코퍼스가 커져도 전체 스캔 없음
+# ---------------------------------------------------------------------
+MINHASH_NGRAM = 3
+MINHASH_NUM_PERM = 128
+MINHASH_BANDS = 16
+MINHASH_ROWS = MINHASH_NUM_PERM // MINHASH_BANDS
+MINHASH_MIN_SHINGLES = 20              # 이보다 짧은 글은 탐지 대상에서 제외
+DUPLICATE_THRESHOLD = float(os.environ.get("DUPLICATE_THRESHOLD", "0.7"))
+DUPLICATE_REUSE_THRESHOLD = float(os.environ.get("DUPLICATE_REUSE_THRESHOLD", "0.9"))
+DUPLICATE_MAX_CANDIDATES = int(os.environ.get("DUPLICATE_MAX_CANDIDATES", "200"))  # 서명 비교 후보 상한
+
+_MINHASH_PRIME = np.uint64(4294967291)  # 2^32 미만 최대 소수 → a*x+b 가 uint64를 넘지 않음
+_minhash_rng = np.random.RandomState(20240229)  # 고정 시드: 워커/재시작 간 서명 호환
+_MINHASH_A = _minhash_rng.randint(1, 2**32 - 5, size=MINHASH_NUM_PERM, dtype=np.uint64)
+_MINHASH_B = _minhash_rng.randint(0, 2**32 - 5, size=MINHASH_NUM_PERM, dtype=np.uint64)
+
+class EssaySignature(Base):
+    __tablename__ = "essay_signatures"
+    report_id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, nullable=True, index=True)
+    signature = Column(LargeBinary, nullable=False)  # uint32 × NUM_PERM
+
+class EssayLshBucket(Base):
+    __tablename__ = "essay_lsh_buckets"
+    id = Column(Integer, primary_key=True)
+    band = Column(Integer, nullable=False)
+    bucket = Column(BigInteger, nullable=False)
+    report_id = Column(Integer, nullable=False, index=True)
+
+    __table_args__ = (
+        Index("ix_essay_lsh_band_bucket", "band", "bucket"),
+    )
+
+Base.metadata.create_all(engine, tables=[EssaySignature.__table__, EssayLshBucket.__table__])
+
+def _essay_shingles(essay: str) -> np.ndarray:
+    """공백/문장부호 제거 후 문자 n-gram → crc32 해시 배열 (중복 제거)"""
+    norm = re.sub(r"[\W_]+", "", essay or "")
+    n = MINHASH_NGRAM
+    if len(norm) < n:
+        return np.zeros(0, dtype=np.uint64)
+    grams = {zlib.crc32(norm[i:i + n].encode("utf-8")) for i in range(len(norm) - n + 1)}
+    return np.fromiter(grams, dtype=np.uint64, count=len(grams))
+
+def minhash_signature(essay: str):
+    """MinHash 서명 (uint32 배열). 너무 짧은 글이면 None."""
+    sh = _essay_shingles(essay)
+    if sh.size < MINHASH_MIN_SHINGLES:
+        return None
+    # [perm, shingle] 해시 행렬의 행별 최솟값
+    hv = (np.outer(_MINHASH_A, sh) + _MINHASH_B[:, None]) % _MINHASH_PRIME
+    return hv.min(axis=1).astype(np.uint32)
+
+def _lsh_buckets(sig: np.ndarray):
+    """밴드별 버킷 키 (signed 64bit, DB BigInteger 호환)"""
+    out = []
+    for b in range(MINHASH_BANDS):
+        chunk = sig[b * MINHASH_ROWS:(b + 1) * MINHASH_ROWS].tobytes()
+        h = hashlib.blake2b(chunk, digest_size=8).digest()
+        out.append((b, int.from_bytes(h, "big", signed=True)))
+    return out
+
+def _index_essay(db, report: Report, payload: dict):
+    """리포트 논술문을 MinHash/LSH 인덱스에 반영"""
+    sig = minhash_signature(_s(payload.get("essay")) if isinstance(payload, dict) else "")
+    if sig is None:
+        return
+    db.query(EssayLshBucket).filter(EssayLshBucket.report_id == report.id).delete()
+    db.merge(EssaySignature(report_id=report.id, user_id=report.user_id, signature=sig.tobytes()))
+    db.add_all([
+        EssayLshBucket(band=b, bucket=k, report_id=report.id)
+        for b, k in _lsh_buckets(sig)
+    ])
+
+def find_near_duplicates(db, essay: str, user_id=None, threshold: float = None, limit: int = 5):
+    """
+    유사 논술문 조회 → [{"report_id", "similarity"}] (유사도 내림차순)
+    similarity는 MinHash로 추정한 자카드 유사도
+    """
+    threshold = DUPLICATE_THRESHOLD if threshold is None else threshold
+    sig = minhash_signature(essay)
+    if sig is None:
+        return []
+
+    conds = [
+        and_(EssayLshBucket.band == b, EssayLshBucket.bucket == k)
+        for b, k in _lsh_buckets(sig)
+    ]
+    # 후보 선정은 DB 안에서: 사용자 필터 + 겹친 밴드 수가 많은 순으로 상한까지만
+    # (다른 사용자 id 를 가져오거나 IN (...) 목록이 커지지 않도록)
+    hits = (
+        db.query(EssayLshBucket.report_id.label("rid"), func.count().label("n"))
+        .join(EssaySignature, EssaySignature.report_id == EssayLshBucket.report_id)
+        .filter(or_(*conds))
+    )
+    if user_id is not None:
+        hits = hits.filter(EssaySignature.user_id == user_id)
+    hits = (
+        hits.group_by(EssayLshBucket.report_id)
+        .order_by(func.count().desc())
+        .limit(DUPLICATE_MAX_CANDIDATES)
+        .subquery()
+    )
+    cands = (
+        db.query(EssaySignature.report_id, EssaySignature.signature)
+        .join(hits, hits.c.rid == EssaySignature.report_id)
+        .all()
+    )
+    if not cands:
+        return []
+
+    mat = np.frombuffer(b"".join(c.signature for c in cands), dtype=np.uint32).reshape(len(cands), -1)
+    sims = (mat == sig[None, :]).mean(axis=1)
+    out = [
+        {"report_id": cands[i].report_id, "similarity": round(float(sims[i]), 3)}
+        for i in np.argsort(-sims)
+        if sims[i] >= threshold
+    ]
+    return out[:limit]
+
+def backfill_essay_index(batch_size: int = 500) -> int:
+    """기존 리포트 논술문 전체를 MinHash/LSH 인덱스에 반영. 반영한 건수를 반환."""
+    done = 0
+    last_id = 0
+    while True:
+        db = SessionLocal()
+        try:
+            rows = (
+                db.query(Report)
+                .filter(Report.id > last_id)
+                .order_by(Report.id)
+                .limit(batch_size)
+                .all()
+            )
+            if not rows:
+                break
+            for r in rows:
+                try:
+                    p = json.loads(r.payload_json)
+                except Exception:
+                    p = {}
+                _index_essay(db, r, p)
+                done += 1
+            db.commit()
+            last_id = rows[-1].id
+        finally:
+            db.close()
+    return done
+
+@app.cli.command("duplicates-backfill")
+def duplicates_backfill_command():
+    """flask --app app duplicates-backfill : 기존 논술문 유사도 인덱스 재구축"""
+    n = backfill_essay_index()
+    print(f"✅ 유사도 인덱스 반영 완료: {n}건", flush=True)
+
 # ---------------------------------------------------------------------
 # Login Manager
 # ---------------------------------------------------------------------
 login_manager = LoginManager()
 login_manager.init_app(app)
 
-@login_manager.user_loader
-def load_user(user_id):
+USER_CACHE_TTL_SEC = 300
+
+def _load_user_row(user_id: int):
     db = SessionLocal()
     try:
-        return db.query(User).get(int(user_id))  # SA 2.x 경고만 뜨는 구문(동작 OK)
+        u = db.query(User).get(user_id)  # SA 2.x 경고만 뜨는 구문(동작 OK)
+        # 비밀번호 해시는 공유 캐시에 두지 않음 (로그인 검증은 항상 DB 조회)
+        if not u:
+            return None
+        return {"id": u.id, "email": u.email, "name": u.name,
+                "created_at": u.created_at.isoformat() if u.created_at else None}
     finally:
         db.close()
 
+@login_manager.user_loader
+def load_user(user_id):
+    """매 요청마다 호출되므로 사용자 정보는 공유 캐시를 거쳐 조회"""
+    try:
+        uid = int(user_id)
+    except (TypeError, ValueError):
+        return None
+    row = shared_cache.get_or_set("user", str(uid), lambda: _load_user_row(uid), ttl=USER_CACHE_TTL_SEC)
+    if not row:
+        return None
+    created = row.get("created_at")
+    return User(**{**row, "created_at": datetime.fromisoformat(created) if created else None})
+
 def _normalize_email(s):
     return (s or "").strip().lower()
 
@@ -307,79 +1777,641 @@ def parse_review_text(block: str):
 
 
 # ---------------------------------------------------------------------
-# Admin seed (선택)
+# 📝 Prompt templates
+#   프롬프트 순서: [고정 지시문] → [제시문·질문] → [논술문/요청별 값]
+#   - 고정 지시문은 모듈 로드 시 한 번만 만들어 두고 모든 요청에서 동일 → 공급자 측
+#     prompt prefix 캐시가 적중하도록 요청별 값(글자 수 등)은 절대 앞에 두지 않음
+#   - 제시문·질문 구간은 LRU 캐시, book_items.json 항목은 시작 시 미리 렌더링
+#   - 문구를 바꾸면 PROMPT_VERSION 을 올릴 것 (응답의 llm.prompt_version 으로 추적)
 # ---------------------------------------------------------------------
-ADMIN_EMAIL = os.environ.get("ADMIN_EMAIL")
-ADMIN_PASSWORD = os.environ.get("ADMIN_PASSWORD", "changeme!")
-ADMIN_NAME = os.environ.get("ADMIN_NAME", "Admin")
+PROMPT_VERSION = "2"
 
-if ADMIN_EMAIL:
-    db = SessionLocal()
-    try:
-        if not db.query(User).filter_by(email=_normalize_email(ADMIN_EMAIL)).first():
-            u = User(email=_normalize_email(ADMIN_EMAIL), name=ADMIN_NAME)
-            u.set_password(ADMIN_PASSWORD)
-            db.add(u)
-            db.commit()
-            print(f"✅ Seeded admin: {ADMIN_EMAIL}", flush=True)
-    finally:
-        db.close()
+REVIEW_SYSTEM_PROMPT = "너는 초등 논술 첨삭 선생님이야. 제시문과 이미지 해석 기준을 근거로 평가만 작성해."
 
-def _is_admin(user: User) -> bool:
-    return bool(ADMIN_EMAIL and user and _normalize_email(user.email) == _normalize_email(ADMIN_EMAIL))
+REVIEW_STATIC_PREFIX = """
+당신은 초등학생을 가르치는 논술 선생님입니다.
 
-# ---------------------------------------------------------------------
-# Routes
-# ---------------------------------------------------------------------
-@app.get("/healthz")
-def healthz():
-    return "ok", 200
+다음은 논술 평가 기준입니다:
 
-@app.get("/")
-def index():
-    resp = make_response(render_template("index.html"))
-    resp.headers["Cache-Control"] = "no-store"
-    return resp
+[논리력] 
+- 논제가 요구한 질문에 정확히 답했는가?
+- 글의 주장이 분명하게 드러났는가?
+- 제시문을 활용하여 주장을 뒷받침했는가?
+- 글 전체가 읽는 사람을 충분히 설득할 수 있을 만큼 논리적으로 전개되었는가?
+- ❗ 근거가 없거나 근거가 약하거나, 설득력이 부족한 경우에는 반드시 크게 감점하라 (0~4점 이하).
 
-# ---------- Auth ----------
-@app.post("/auth/register")
-def auth_register():
-    data = request.get_json(force=True)
-    email = _normalize_email(data.get("email"))
-    password = _s(data.get("password"))
-    name = _s(data.get("name"))
+[독해력] 
+- 제시문 속 핵심 내용을 올바르게 요약하거나 인용했는가?
+- 질문에 대한 답변이 글 속에서 명확하게 드러났는가?
+- 제시문을 근거로 삼아 논지를 전개했는가?
+- ❗ 제시문 외의 배경지식이나 외부 정보를 활용한 경우에는 반드시 크게 감점하라 (0~4점 이하).
 
-    if not email or not password or not name:
-        return jsonify({"ok": False, "error": "필수 정보가 누락되었습니다."}), 400
-    if len(password) < 6:
-        return jsonify({"ok": False, "error": "비밀번호는 6자 이상이어야 합니다."}), 400
-    if len(password.encode("utf-8")) > 72:
-        return jsonify({"ok": False, "error": "비밀번호는 [영문 72자, 한글 약 24자] 이하로 설정해 주세요."}), 400
+[구성력] 
+- 문단 구분과 들여쓰기가 잘 되어 있는가? (맨 아래 '자동 분석 결과'의 문단/들여쓰기 수치를 근거로 판단)
+- 글 전체의 논리적 흐름이 자연스럽고 방해되지 않는가?
 
-    db = SessionLocal()
-    try:
-        if db.query(User).filter_by(email=email).first():
-            return jsonify({"ok": False, "error": "이미 가입된 이메일입니다."}), 400
-        user = User(email=email, name=name)
-        user.set_password(password)
-        db.add(user)
-        db.commit()
-        login_user(user, remember=True)
-        return jsonify({"ok": True, "user": {"id": user.id, "email": user.email, "name": user.name, "is_admin": _is_admin(user)}})
-    finally:
-        db.close()
+[표현력] 
+- 문법에 맞는 문장을 구사했는가?
+- 적절한 어휘를 사용했는가?
+- 맞춤법이 틀리지 않았는가?
+- 문장이 어색하거나 문법적으로 잘못된 경우(비문)는 감점하라.
 
-@app.post("/auth/login")
-def auth_login():
-    data = request.get_json(force=True)
-    email = _normalize_email(data.get("email"))
-    password = _s(data.get("password"))
+---
 
-    db = SessionLocal()
-    try:
-        user = db.query(User).filter_by(email=email).first()
-        if not user or not user.check_password(password):
-            return jsonify({"ok": False, "error": "이메일 또는 비밀번호가 올바르지 않습니다."}), 401
+❗ 답변은 아래 형식을 반드시 그대로 지켜서 작성해 주세요:
+
+[논리력]  
+점수: (0~10 사이의 정수만)  
+이유: (한 문장 이상 구체적으로 작성)
+
+[독해력]  
+점수: (정수만)  
+이유: (한 문장 이상 구체적으로 작성)
+
+[구성력]  
+점수: (정수만)  
+이유: (한 문장 이상 구체적으로 작성)
+
+[표현력]  
+점수: (정수만)  
+이유: (한 문장 이상 구체적으로 작성)
+
+❗ 다른 형식은 사용하지 말고 위와 같이 숫자 점수와 이유를 항목별로 분리해서 반드시 작성하세요.
+예시답안은 지금 작성하지 마세요.
+
+[총평]
+한 줄(50~100자)로 전체 인상을 요약하세요. 학생글을 기반으로 잘한 점과, 가장 미흡한 항목을 중심으로 구체적어주세요. 1문장만 작성하세요.
+
+---
+
+평가할 자료는 아래와 같습니다.
+""".strip()
+
+EXAMPLE_SYSTEM_PROMPT = (
+    "너는 고등학생 논술 첨삭 선생님이다. "
+    "예시답안과 비교설명 작성 시 제시문과 이미지 해석 기준 외의 "
+    "배경지식, 사실, 사례 사용은 절대 금지다. "
+    "출력은 반드시 JSON만 사용한다."
+)
+
+EXAMPLE_STATIC_PREFIX = """
+아래는 학생이 작성한 논술문입니다. 이 글을 바탕으로 다음 작업을 수행해 주십시오.
+
+1. 학생의 논술문을 기반으로, 평가 기준을 고려하여 예시답안을 작성하십시오.
+- 문체는 고등학교 논술 평가에 적합하게 단정하고 객관적인 서술을 유지하십시오.
+- 예시답안은 반드시 제시문(텍스트 + 이미지 해석 기준)에 포함된 정보와 주장 흐름만으로 구성하십시오.
+- 제시문 밖의 배경지식, 상식, 사례, 정의 등을 활용하면 오답으로 간주합니다.
+- 모든 주장과 근거는 반드시 제시문과 이미지 해석 기준에서만 취하십시오.
+- 예시답안 서두에 질문에 대한 명확한 답변을 반드시 제시하십시오.
+- 글자 수는 맨 아래 '분량 기준'을 따르십시오.
+
+2. 예시답안과 학생의 논술문을 비교하여 분석하십시오. 각 항목별로 다음을 포함하십시오:
+- 학생의 미흡한 문장 (직접 인용)
+- 어떤 평가 기준에서 부족했는가
+- 예시답안에서 어떻게 개선되었는가
+
+3. 반드시 아래 JSON 형식으로만 출력하십시오. 설명 문구를 붙이지 마십시오.
+
+{
+  "example": "예시답안을 여기에 작성하십시오.",
+  "comparison": "비교 설명을 여기에 작성하십시오. 반드시 500~700자 분량."
+}
+""".strip()
+
+@functools.lru_cache(maxsize=1024)
+def _passages_segment(passages: tuple, question: str) -> str:
+    """제시문 + 질문 구간 (책 항목마다 동일하므로 캐시)"""
+    return (
+        f"제시문(텍스트):\n{_format_passages_block(list(passages), [])}\n\n"
+        f"질문:\n{question}"
+    )
+
+def render_review_prompt(passages, question: str, essay: str, analysis: dict) -> str:
+    return "\n\n".join([
+        REVIEW_STATIC_PREFIX,
+        _passages_segment(tuple(passages), question),
+        f"논술문:\n{essay}",
+        f"자동 분석 결과(사전 계산된 수치, 그대로 신뢰할 것):\n{_format_analysis_block(analysis)}",
+    ])
+
+def render_example_prompt(passages, question: str, essay: str, char_base: int, char_range: int) -> str:
+    return "\n\n".join([
+        EXAMPLE_STATIC_PREFIX,
+        _passages_segment(tuple(passages), question),
+        f"학생의 논술문:\n{essay}",
+        f"분량 기준: 예시답안은 학생 논술문 기준({char_base} ± {char_range}자) 내에서 작성하십시오.",
+    ])
+
+def warm_prompt_cache() -> int:
+    """book_items.json 의 제시문·질문 구간을 미리 렌더링. 렌더링한 항목 수 반환."""
+    path = os.path.join(BASE_DIR, "static", "book_items.json")
+    try:
+        with open(path, encoding="utf-8") as f:
+            items = json.load(f)
+    except Exception as e:
+        print("❗ book_items.json 로드 실패 (프롬프트 캐시 생략):", e, flush=True)
+        return 0
+    n = 0
+    for item in items if isinstance(items, list) else []:
+        if not isinstance(item, dict):
+            continue
+        _passages_segment(tuple(_coerce_passages(item.get("passages"))), _s(item.get("question")))
+        n += 1
+    return n
+
+warm_prompt_cache()
+
+# ---------------------------------------------------------------------
+# Admin seed (선택)
+# ---------------------------------------------------------------------
+ADMIN_EMAIL = os.environ.get("ADMIN_EMAIL")
+ADMIN_PASSWORD = os.environ.get("ADMIN_PASSWORD", "changeme!")
+ADMIN_NAME = os.environ.get("ADMIN_NAME", "Admin")
+
+if ADMIN_EMAIL:
+    db = SessionLocal()
+    try:
+        if not db.query(User).filter_by(email=_normalize_email(ADMIN_EMAIL)).first():
+            u = User(email=_normalize_email(ADMIN_EMAIL), name=ADMIN_NAME)
+            u.set_password(ADMIN_PASSWORD)
+            db.add(u)
+            db.commit()
+            print(f"✅ Seeded admin: {ADMIN_EMAIL}", flush=True)
+    finally:
+        db.close()
+
+def _is_admin(user: User) -> bool:
+    return bool(ADMIN_EMAIL and user and _normalize_email(user.email) == _normalize_email(ADMIN_EMAIL))
+
+# ---------------------------------------------------------------------
+# 🚦 Admission control (비싼 엔드포인트 동시 실행 제한)
+#   - 사용자별 동시 실행 상한, 엔드포인트별 전체 동시 실행 상한
+#   - 상한 초과 시 제한된 길이의 대기열에서 deadline까지 대기
+#   - 대기열이 꽉 찼거나 deadline을 넘기면 즉시 429 + Retry-After
+#   - 상태는 파일 1개 + flock 으로 같은 호스트의 gunicorn 워커끼리 공유
+# ---------------------------------------------------------------------
+ADMISSION_ENABLED = os.environ.get("ADMISSION_ENABLED", "1") == "1"
+ADMISSION_STATE_PATH = os.environ.get(
+    "ADMISSION_STATE_PATH", os.path.join(tempfile.gettempdir(), "essay_admission.json")
+)
+ADMISSION_PER_USER = int(os.environ.get("ADMISSION_PER_USER", "2"))
+ADMISSION_LEASE_SEC = 300      # 워커가 죽어도 슬롯이 영원히 잡히지 않도록 임대 만료
+ADMISSION_POLL_SEC = 0.1
+
+def _admission_limit(group: str, name: str, default):
+    return type(default)(os.environ.get(f"ADMISSION_{group.upper()}_{name}", default))
+
+# group: (전체 동시 실행 수, 대기열 길이, 최대 대기 초)
+ADMISSION_GROUPS = {
+    "review":  (_admission_limit("review", "GLOBAL", 6),  _admission_limit("review", "QUEUE", 12), _admission_limit("review", "WAIT", 10.0)),
+    "example": (_admission_limit("example", "GLOBAL", 4), _admission_limit("example", "QUEUE", 8),  _admission_limit("example", "WAIT", 10.0)),
+    "pdf":     (_admission_limit("pdf", "GLOBAL", 2),     _admission_limit("pdf", "QUEUE", 6),      _admission_limit("pdf", "WAIT", 15.0)),
+}
+
+_admission_thread_lock = threading.Lock()
+
+class AdmissionRejected(Exception):
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+@contextlib.contextmanager
+def _admission_state():
+    """상태 파일을 배타 잠금으로 열고 dict로 넘겨준 뒤, 끝나면 다시 기록"""
+    with _admission_thread_lock:
+        fd = os.open(ADMISSION_STATE_PATH, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            if fcntl:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+            raw = b""
+            while True:
+                chunk = os.read(fd, 65536)
+                if not chunk:
+                    break
+                raw += chunk
+            try:
+                state = json.loads(raw.decode("utf-8")) if raw else {}
+            except Exception:
+                state = {}
+            try:
+                yield state
+            finally:
+                # 거절(예외)로 빠져나가도 대기열에서 뺀 상태는 기록해야 함
+                data = json.dumps(state).encode("utf-8")
+                os.lseek(fd, 0, os.SEEK_SET)
+                os.ftruncate(fd, 0)
+                os.write(fd, data)
+        finally:
+            if fcntl:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+            os.close(fd)
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+        return True
+    except ProcessLookupError:
+        return False
+    except Exception:
+        return True
+
+def _admission_group(state: dict, group: str) -> dict:
+    """그룹 상태 꺼내기 + 만료/죽은 워커 슬롯 정리"""
+    grp = state.setdefault(group, {"running": {}, "waiting": [], "ewma": 5.0})
+    now = time.time()
+
+    def live(entry):
+        return entry["expires"] > now and _pid_alive(entry["pid"])
+
+    grp["running"] = {t: e for t, e in grp["running"].items() if live(e)}
+    grp["waiting"] = [e for e in grp["waiting"] if live(e)]
+    return grp
+
+def _retry_after(grp: dict, limit: int) -> int:
+    """평균 처리 시간 × (대기열 / 동시 실행 수) 로 재시도 시점 추정"""
+    return max(1, int(math.ceil(grp["ewma"] * (len(grp["waiting"]) + 1) / max(1, limit))))
+
+def admission_acquire(group: str, user_key: str) -> str:
+    """슬롯 획득 → ticket 반환. 거절되면 AdmissionRejected."""
+    limit, queue_size, max_wait = ADMISSION_GROUPS[group]
+    ticket = uuid.uuid4().hex
+    entry = {"ticket": ticket, "user": user_key, "pid": os.getpid(),
+             "expires": time.time() + ADMISSION_LEASE_SEC, "since": time.time()}
+
+    with _admission_state() as state:
+        grp = _admission_group(state, group)
+        mine = sum(1 for e in list(grp["running"].values()) + grp["waiting"] if e["user"] == user_key)
+        if mine >= ADMISSION_PER_USER:
+            raise AdmissionRejected("이미 진행 중인 요청이 있습니다. 잠시 후 다시 시도해 주세요.", _retry_after(grp, limit))
+        if len(grp["running"]) < limit and not grp["waiting"]:
+            grp["running"][ticket] = entry
+            return ticket
+        if len(grp["waiting"]) >= queue_size:
+            raise AdmissionRejected("요청이 많아 잠시 후 다시 시도해 주세요.", _retry_after(grp, limit))
+        grp["waiting"].append(entry)
+
+    deadline = time.time() + max_wait
+    while True:
+        time.sleep(ADMISSION_POLL_SEC * (0.5 + random.random()))
+        with _admission_state() as state:
+            grp = _admission_group(state, group)
+            pos = next((i for i, e in enumerate(grp["waiting"]) if e["ticket"] == ticket), None)
+            if pos is None:  # 임대 만료 등으로 정리된 경우 다시 줄 세우지 않고 거절
+                raise AdmissionRejected("요청이 많아 잠시 후 다시 시도해 주세요.", _retry_after(grp, limit))
+            # 대기열 앞쪽부터 빈 슬롯 수만큼 입장 (FIFO)
+            if pos < limit - len(grp["running"]):
+                grp["waiting"].pop(pos)
+                entry["since"] = time.time()
+                grp["running"][ticket] = entry
+                return ticket
+            if time.time() >= deadline:
+                grp["waiting"].pop(pos)
+                raise AdmissionRejected("요청이 많아 잠시 후 다시 시도해 주세요.", _retry_after(grp, limit))
+
+def admission_release(group: str, ticket: str):
+    with _admission_state() as state:
+        grp = _admission_group(state, group)
+        e = grp["running"].pop(ticket, None)
+        if e:
+            # 처리 시간 지수이동평균 (Retry-After 추정용)
+            grp["ewma"] = 0.8 * grp["ewma"] + 0.2 * (time.time() - e["since"])
+
+def admission_refresh(group: str, ticket: str):
+    """오래 걸리는 작업(일괄 내보내기 등)이 진행 중일 때 임대 연장 → 만료로 슬롯이 정리되지 않게"""
+    with _admission_state() as state:
+        e = _admission_group(state, group)["running"].get(ticket)
+        if e:
+            e["expires"] = time.time() + ADMISSION_LEASE_SEC
+
+def _admission_user_key() -> str:
+    if current_user.is_authenticated:
+        return f"u:{current_user.id}"
+    # ProxyFix 가 신뢰 hop 수만큼만 반영한 주소 (클라이언트가 보낸 X-Forwarded-For 는 무시됨)
+    return "ip:" + (request.remote_addr or "-")
+
+def _admission_rejected_response(e: AdmissionRejected):
+    resp = jsonify({"ok": False, "error": str(e)})
+    resp.status_code = 429
+    resp.headers["Retry-After"] = str(e.retry_after)
+    return resp
+
+def admission(group: str):
+    """비싼 라우트에 붙이는 데코레이터: 슬롯 획득 실패 시 429 + Retry-After"""
+    def deco(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not ADMISSION_ENABLED:
+                return fn(*args, **kwargs)
+            try:
+                ticket = admission_acquire(group, _admission_user_key())
+            except AdmissionRejected as e:
+                return _admission_rejected_response(e)
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                admission_release(group, ticket)
+        return wrapper
+    return deco
+
+# ---------- 정적 자산 파이프라인 ----------
+#   빌드 도구 없이 서버 시작 시 처리
+#   - 템플릿에서 asset_url('...') 로 참조하는 static 파일만 내용 해시로 지문
+#     → /assets/<경로>.<해시>.<확장자> (제시문 이미지 등 나머지는 /static 그대로)
+#   - index.html 의 인라인 <style>/<script> 는 지문 붙은 파일로 추출
+#   - 텍스트 자산은 gzip (brotli 설치 시 br 도) 으로 미리 압축
+#   - /assets/* 는 1년 immutable 캐시, index HTML 은 ETag 재검증
+ASSET_PIPELINE = os.environ.get("ASSET_PIPELINE", "1") == "1"
+ASSET_DIR = os.environ.get("ASSET_DIR", os.path.join(BASE_DIR, ".assets"))
+ASSET_MAX_AGE = 365 * 24 * 3600
+_ASSET_COMPRESSIBLE = (".css", ".js", ".json", ".svg", ".txt", ".html")
+_ASSET_MIN_COMPRESS = 1024
+_INLINE_BLOCK_RE = re.compile(r"<(style|script)>(.*?)</\1>", re.S)
+_ASSET_URL_RE = re.compile(r"""asset_url\(\s*['"]([^'"]+)['"]\s*\)""")
+_ASSET_NAME_RE = re.compile(r"^(.*)\.[0-9a-f]{12}(\.[^./]+)?(?:\.gz|\.br)?$")
+
+_assets = {}          # 지문 이름 → {"path", "mimetype", "gzip", "br"}
+_asset_manifest = {}  # static 상대 경로 → 지문 이름
+_index_shell = {"key": None}
+_index_shell_lock = threading.Lock()
+
+def _write_asset_file(path: str, data: bytes):
+    # 이름이 내용 해시라 이미 있으면 같은 내용 (여러 워커가 동시에 빌드해도 안전)
+    if os.path.exists(path):
+        return
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+def _precompress(name: str, data: bytes) -> dict:
+    out = {"gzip": None, "br": None}
+    if not name.endswith(_ASSET_COMPRESSIBLE) or len(data) < _ASSET_MIN_COMPRESS:
+        return out
+    out["gzip"] = os.path.join(ASSET_DIR, name + ".gz")
+    _write_asset_file(out["gzip"], gzip.compress(data, compresslevel=9, mtime=0))
+    if brotli is not None:
+        out["br"] = os.path.join(ASSET_DIR, name + ".br")
+        _write_asset_file(out["br"], brotli.compress(data, quality=11))
+    return out
+
+def _register_asset(name: str, path: str, data: bytes):
+    _assets[name] = {
+        "path": path,
+        "mimetype": mimetypes.guess_type(name)[0] or "application/octet-stream",
+        **_precompress(name, data),
+    }
+
+def _referenced_static_assets():
+    """templates/* 에서 asset_url('<경로>') 로 참조하는 static 상대 경로 목록"""
+    refs = set()
+    for root, _, files in os.walk(app.template_folder):
+        for fn in files:
+            try:
+                with open(os.path.join(root, fn), encoding="utf-8") as f:
+                    refs.update(r.lstrip("/") for r in _ASSET_URL_RE.findall(f.read()))
+            except (OSError, UnicodeDecodeError):
+                continue
+    return sorted(refs)
+
+def _prune_asset_dir():
+    """이전 빌드가 남긴, 이제 참조되지 않는 static 파일의 스냅숏 삭제 (index/ 번들과 참조 중인 파일의 옛 버전은 유지)"""
+    for root, _, files in os.walk(ASSET_DIR):
+        for fn in files:
+            path = os.path.join(root, fn)
+            name = os.path.relpath(path, ASSET_DIR).replace(os.sep, "/")
+            m = _ASSET_NAME_RE.match(name)
+            if not m or name.startswith("index/"):
+                continue
+            if m.group(1) + (m.group(2) or "") not in _asset_manifest:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+def build_static_assets():
+    """
+    참조되는 static 파일 지문 + 미리 압축 + index 셸(인라인 자산 추출)까지 시작 시 모두 생성
+    - 내용은 ASSET_DIR 에 스냅숏으로 복사: 원본이 바뀌어도 기존 해시 URL 은 옛 내용 그대로
+    """
+    t0 = time.perf_counter()
+    static_dir = app.static_folder
+    for rel in _referenced_static_assets():
+        path = os.path.realpath(os.path.join(static_dir, rel))
+        if not path.startswith(os.path.realpath(static_dir) + os.sep):
+            continue
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except OSError:
+            print(f"❗ asset_url 이 참조하는 파일이 없습니다: static/{rel}", flush=True)
+            continue
+        base, ext = os.path.splitext(rel)
+        name = f"{base}.{hashlib.sha256(data).hexdigest()[:12]}{ext}"
+        snapshot = os.path.join(ASSET_DIR, name)
+        _write_asset_file(snapshot, data)
+        _register_asset(name, snapshot, data)
+        _asset_manifest[rel] = name
+    _prune_asset_dir()
+    # 어느 워커든 첫 요청 전에 index/*.js|css 를 서빙할 수 있도록 셸도 미리 생성
+    with app.app_context():
+        _index_shell_html()
+    print(f"📦 정적 자산 {len(_asset_manifest)}개 지문 완료 ({time.perf_counter() - t0:.2f}s, brotli={'on' if brotli else 'off'})", flush=True)
+
+@app.template_global()
+def asset_url(rel: str) -> str:
+    rel = rel.lstrip("/")
+    name = _asset_manifest.get(rel)
+    return f"/assets/{name}" if name else f"/static/{rel}"
+
+def _extract_inline_assets(html: str) -> str:
+    """인라인 <style>/<script> → 지문 붙은 외부 파일 (블록 순서/개수 유지)"""
+    def repl(m):
+        tag, data = m.group(1), m.group(2).encode("utf-8")
+        ext = "css" if tag == "style" else "js"
+        name = f"index/{tag}.{hashlib.sha256(data).hexdigest()[:12]}.{ext}"
+        path = os.path.join(ASSET_DIR, name)
+        _write_asset_file(path, data)
+        _register_asset(name, path, data)
+        if tag == "style":
+            return f'<link rel="stylesheet" href="/assets/{name}" />'
+        return f'<script src="/assets/{name}"></script>'
+    return _INLINE_BLOCK_RE.sub(repl, html)
+
+def _index_shell_html():
+    """index.html 렌더 결과 캐시 (템플릿 수정 시각이 바뀌면 다시 생성)"""
+    key = os.path.getmtime(os.path.join(app.template_folder, "index.html"))
+    with _index_shell_lock:
+        if _index_shell["key"] != key:
+            html = render_template("index.html")
+            if ASSET_PIPELINE:
+                html = _extract_inline_assets(html)
+            data = html.encode("utf-8")
+            _index_shell.update(
+                key=key,
+                html=data,
+                gzip=gzip.compress(data, compresslevel=9, mtime=0),
+                etag=hashlib.sha256(data).hexdigest()[:32],
+            )
+        return _index_shell
+
+if ASSET_PIPELINE:
+    build_static_assets()
+
+# ---------------------------------------------------------------------
+# Routes
+# ---------------------------------------------------------------------
+@app.get("/healthz")
+def healthz():
+    return "ok", 200
+
+@app.get("/")
+def index():
+    """HTML 셸: 매번 ETag 로 재검증 (JS/CSS 는 /assets 에서 immutable 캐시)"""
+    shell = _index_shell_html()
+    if request.accept_encodings["gzip"]:
+        resp = make_response(shell["gzip"])
+        resp.headers["Content-Encoding"] = "gzip"
+        resp.set_etag(shell["etag"] + "-gz")
+    else:
+        resp = make_response(shell["html"])
+        resp.set_etag(shell["etag"])
+    resp.mimetype = "text/html"
+    resp.headers["Vary"] = "Accept-Encoding"
+    resp.headers["Cache-Control"] = "no-cache"
+    return resp.make_conditional(request)
+
+def _asset_from_disk(name: str):
+    """
+    다른 워커/이전 프로세스가 만든 자산이면 ASSET_DIR 의 내용 주소 파일로 등록
+    (템플릿이 바뀐 뒤 다른 워커가 만든 index/* 파일 등)
+    """
+    if name.endswith((".gz", ".br", ".tmp")):
+        return None
+    root = os.path.realpath(ASSET_DIR)
+    path = os.path.realpath(os.path.join(root, name))
+    if not path.startswith(root + os.sep) or not os.path.isfile(path):
+        return None
+    with open(path, "rb") as f:
+        data = f.read()
+    _register_asset(name, path, data)
+    return _assets[name]
+
+@app.get("/assets/<path:name>")
+def serve_asset(name):
+    """지문 붙은 정적 자산: 미리 압축된 br/gzip 우선, 1년 immutable 캐시"""
+    entry = _assets.get(name) or _asset_from_disk(name)
+    if not entry:
+        return jsonify({"ok": False, "error": "자산을 찾을 수 없습니다."}), 404
+    path, encoding = entry["path"], None
+    if entry["br"] and request.accept_encodings["br"]:
+        path, encoding = entry["br"], "br"
+    elif entry["gzip"] and request.accept_encodings["gzip"]:
+        path, encoding = entry["gzip"], "gzip"
+    resp = send_file(path, mimetype=entry["mimetype"], conditional=True, max_age=ASSET_MAX_AGE)
+    if encoding:
+        resp.headers["Content-Encoding"] = encoding
+    if entry["gzip"]:
+        resp.headers["Vary"] = "Accept-Encoding"
+    resp.headers["Cache-Control"] = f"public, max-age={ASSET_MAX_AGE}, immutable"
+    return resp
+
+@app.get("/admin/metrics")
+@login_required
+def admin_metrics():
+    """현재 워커의 메트릭 (관리자 전용)"""
+    if not _is_admin(current_user):
+        return jsonify({"ok": False, "error": "권한이 없습니다."}), 403
+    return jsonify({"ok": True, **metrics_snapshot()})
+
+@app.get("/admin/cache")
+@login_required
+def admin_cache():
+    """공유 캐시 사용량 / 적중률 (관리자 전용, 카운터는 현재 워커 기준)"""
+    if not _is_admin(current_user):
+        return jsonify({"ok": False, "error": "권한이 없습니다."}), 403
+    return jsonify({"ok": True, **shared_cache.stats()})
+
+@app.get("/admin/profiles")
+@login_required
+def admin_profiles():
+    """
+    최근 프로파일 중 느린 요청 순 목록 (관리자 전용)
+    - 쿼리: limit (기본 20), path (접두어 필터)
+    """
+    if not _is_admin(current_user):
+        return jsonify({"ok": False, "error": "권한이 없습니다."}), 403
+    try:
+        limit = max(1, min(PROFILE_RING_SIZE, int(request.args.get("limit", 20))))
+    except ValueError:
+        limit = 20
+    prefix = _s(request.args.get("path"))
+    items = [p for p in _load_profiles() if not prefix or p.get("path", "").startswith(prefix)]
+    items.sort(key=lambda p: -p.get("wall_ms", 0))
+    return jsonify({"ok": True, "items": [
+        {k: v for k, v in p.items() if k != "folded"} for p in items[:limit]
+    ]})
+
+@app.get("/admin/profiles/<profile_id>")
+@login_required
+def admin_profile_detail(profile_id):
+    """
+    프로파일 1건
+    - format=folded : flamegraph.pl / speedscope 에 바로 넣을 수 있는 folded stack 텍스트
+    """
+    if not _is_admin(current_user):
+        return jsonify({"ok": False, "error": "권한이 없습니다."}), 403
+    if not re.fullmatch(r"\d+_\d+", profile_id):
+        return jsonify({"ok": False, "error": "존재하지 않는 프로파일입니다."}), 404
+    try:
+        with open(os.path.join(PROFILE_DIR, f"{profile_id}.json"), encoding="utf-8") as f:
+            record = json.load(f)
+    except (OSError, ValueError):
+        return jsonify({"ok": False, "error": "존재하지 않는 프로파일입니다."}), 404
+    if request.args.get("format") == "folded":
+        lines = [f"{stack} {n}" for stack, n in sorted(record["folded"].items())]
+        return Response("\n".join(lines) + "\n", mimetype="text/plain")
+    return jsonify({"ok": True, **record})
+
+# ---------- Auth ----------
+@app.post("/auth/register")
+def auth_register():
+    data = request.get_json(force=True)
+    email = _normalize_email(data.get("email"))
+    password = _s(data.get("password"))
+    name = _s(data.get("name"))
+
+    if not email or not password or not name:
+        return jsonify({"ok": False, "error": "필수 정보가 누락되었습니다."}), 400
+    if len(password) < 6:
+        return jsonify({"ok": False, "error": "비밀번호는 6자 이상이어야 합니다."}), 400
+    if len(password.encode("utf-8")) > 72:
+        return jsonify({"ok": False, "error": "비밀번호는 [영문 72자, 한글 약 24자] 이하로 설정해 주세요."}), 400
+
+    db = SessionLocal()
+    try:
+        if db.query(User).filter_by(email=email).first():
+            return jsonify({"ok": False, "error": "이미 가입된 이메일입니다."}), 400
+        user = User(email=email, name=name)
+        user.set_password(password)
+        db.add(user)
+        db.commit()
+        login_user(user, remember=True)
+        return jsonify({"ok": True, "user": {"id": user.id, "email": user.email, "name": user.name, "is_admin": _is_admin(user)}})
+    finally:
+        db.close()
+
+@app.post("/auth/login")
+def auth_login():
+    data = request.get_json(force=True)
+    email = _normalize_email(data.get("email"))
+    password = _s(data.get("password"))
+
+    db = SessionLocal()
+    try:
+        user = db.query(User).filter_by(email=email).first()
+        if not user or not user.check_password(password):
+            return jsonify({"ok": False, "error": "이메일 또는 비밀번호가 올바르지 않습니다."}), 401
         login_user(user, remember=True)
         return jsonify({"ok": True, "user": {"id": user.id, "email": user.email, "name": user.name, "is_admin": _is_admin(user)}})
     finally:
@@ -452,9 +2484,9 @@ def ocr_image():
         image_url = f"data:{mime};base64,{b64}"
 
         # GPT-4-1.-mini 기능 사용해서 OCR
-        resp = client.responses.create(
-            model="gpt-4.1-mini",
-            input=[
+        ocr_request = {
+            "model": "gpt-4.1-mini",
+            "input": [
                 {
                     "role": "user",
                     "content": [
@@ -473,9 +2505,13 @@ def ocr_image():
                     ]
                 }
             ],
-            max_output_tokens=2048,
-        )
-        text = resp.output_text or ""
+            "max_output_tokens": 2048,
+        }
+        with profile_stage("llm:ocr"):
+            text = llm_record_replay(
+                "ocr", ocr_request,
+                lambda: client.responses.create(**ocr_request).output_text or "",
+            )
         return jsonify({"ok": True, "text": text.strip()})
     except Exception as e:
         print("❗ OCR 실패:", e, flush=True)
@@ -531,36 +2567,42 @@ def image_confirm():
 """.strip()
 
     try:
-        resp = client.responses.create(
-            model="gpt-4.1-mini",
-            input=[
-                {
-                    "role": "system",
-                    "content": [
-                        {
-                            "type": "input_text",
-                            "text": system_prompt
-                        }
-                    ]
-                },
-                {
-                    "role": "user",
-                    "content": [
-                        {
-                            "type": "input_text",
-                            "text": user_prompt
-                        },
-                        {
-                            "type": "input_image",
-                            "image_url": image
-                        }
-                    ]
-                }
-            ],
-            max_output_tokens=800,
-        )
+        image_input = [
+            {
+                "role": "system",
+                "content": [
+                    {
+                        "type": "input_text",
+                        "text": system_prompt
+                    }
+                ]
+            },
+            {
+                "role": "user",
+                "content": [
+                    {
+                        "type": "input_text",
+                        "text": user_prompt
+                    },
+                    {
+                        "type": "input_image",
+                        "image_url": image
+                    }
+                ]
+            }
+        ]
+
+        confirm_request = {"model": "gpt-4.1-mini", "input": image_input, "max_output_tokens": 800}
 
-        text = resp.output_text or ""
+        def _call():
+            return llm_record_replay(
+                "image_confirm", confirm_request,
+                lambda: client.responses.create(**confirm_request).output_text or "",
+            )
+
+        # 같은 이미지 확정 요청이 동시에 들어오면 한 번만 호출
+        with profile_stage("llm:image_confirm"):
+            text = singleflight(prompt_hash("image_confirm", image_input), _call, endpoint="image_confirm")
         return jsonify({
             "ok": True,
             "image_desc": text.strip()
@@ -570,8 +2612,210 @@ def image_confirm():
         print("❗ image-confirm 실패:", str(e), flush=True)
         return jsonify({"ok": False, "error": str(e)}), 500
 
+# ---------- 로컬 사전 분석 (모델 호출 전) ----------
+_HANGUL_RE = re.compile(r"[가-힣]")
+_SENTENCE_SPLIT_RE = re.compile(r"(?<=[.!?。])\s+|\n+")
+LONG_SENTENCE_CHARS = 80
+
+def _char_ngrams(t: str, n: int = 2) -> set:
+    t = re.sub(r"[\W_]+", "", t or "")
+    return {t[i:i + n] for i in range(len(t) - n + 1)}
+
+def _parse_char_target(data: dict):
+    """charBase / charRange (example()과 같은 기본값 600 ± 100)"""
+    try:
+        char_base = int(data.get("charBase")) if data.get("charBase") is not None else 600
+        char_range = int(data.get("charRange")) if data.get("charRange") is not None else 100
+    except Exception:
+        char_base, char_range = 600, 100
+    return char_base, char_range
+
+def analyze_essay(essay: str, passages, question: str = "", char_base: int = 600, char_range: int = 100) -> dict:
+    """
+    논술문 로컬 통계
+    - 글자 수(공백 포함/제외, 한글) vs 권장 범위
+    - 문단 수, 들여쓰기 된 문단 수
+    - 문장 수, 평균/최대 문장 길이, 긴 문장 수
+    - 제시문·질문과의 어휘(문자 2-gram) 겹침 비율
+    """
+    raw = essay or ""
+    text_ = raw.strip()
+
+    # 글자 수
+    chars = len(text_)
+    chars_no_space = len(re.sub(r"\s+", "", text_))
+    hangul = len(_HANGUL_RE.findall(text_))
+    min_chars = max(0, char_base - char_range)
+    max_chars = char_base + char_range
+
+    # 문단 / 들여쓰기: 빈 줄 또는 줄바꿈 기준
+    lines = [ln for ln in raw.split("\n") if ln.strip()]
+    indented = sum(1 for ln in lines if ln[:1] in (" ", "\t", "\u3000"))
+    para_lens = [len(ln.strip()) for ln in lines]
+
+    # 문장
+    sentences = [x.strip() for x in _SENTENCE_SPLIT_RE.split(text_) if x and x.strip()]
+    sent_lens = [len(x) for x in sentences]
+
+    # 제시문 겹침: 논술문 2-gram 중 제시문/질문에 등장하는 비율
+    essay_grams = _char_ngrams(text_)
+    passage_grams = set()
+    per_passage = []
+    for ptxt in passages or []:
+        grams = _char_ngrams(ptxt)
+        passage_grams |= grams
+        per_passage.append(round(len(essay_grams & grams) / len(essay_grams), 3) if essay_grams else 0.0)
+    question_grams = _char_ngrams(question)
+    passage_overlap = round(len(essay_grams & passage_grams) / len(essay_grams), 3) if essay_grams else 0.0
+    question_overlap = round(len(essay_grams & question_grams) / len(essay_grams), 3) if essay_grams else 0.0
+
+    return {
+        "chars": chars,
+        "chars_no_space": chars_no_space,
+        "hangul_chars": hangul,
+        "hangul_ratio": round(hangul / chars_no_space, 3) if chars_no_space else 0.0,
+        "char_target": {"base": char_base, "range": char_range, "min": min_chars, "max": max_chars},
+        "length_ok": min_chars <= chars <= max_chars,
+        "paragraphs": len(lines),
+        "indented_paragraphs": indented,
+        "paragraph_lengths": para_lens,
+        "sentences": len(sentences),
+        "sentence_mean": round(sum(sent_lens) / len(sent_lens), 1) if sent_lens else 0.0,
+        "sentence_max": max(sent_lens) if sent_lens else 0,
+        "long_sentences": sum(1 for n in sent_lens if n > LONG_SENTENCE_CHARS),
+        "passage_overlap": passage_overlap,
+        "passage_overlap_each": per_passage,
+        "question_overlap": question_overlap,
+    }
+
+# 검토 불가 판정 기준
+UNREVIEWABLE_MIN_HANGUL = 30           # 한글 30자 미만
+UNREVIEWABLE_MIN_HANGUL_RATIO = 0.3    # 한글 비율 30% 미만
+UNREVIEWABLE_MIN_OVERLAP = 0.05        # 제시문·질문과 2-gram 겹침 5% 미만(주제 이탈)
+
+def _unreviewable_reason(stats: dict, has_passages: bool, has_question: bool = False):
+    """
+    모델 호출 없이 바로 돌려보낼 글이면 사유 문자열, 아니면 None
+    - 주제 이탈 판정은 비교할 제시문·질문 내용이 실제로 있을 때만 (빈 제시문이면 겹칠 어휘가 없음)
+    """
+    if stats["chars"] == 0:
+        return "논술문이 비어 있습니다."
+    if stats["hangul_chars"] < UNREVIEWABLE_MIN_HANGUL:
+        return f"논술문이 너무 짧습니다. (한글 {stats['hangul_chars']}자)"
+    if stats["hangul_ratio"] < UNREVIEWABLE_MIN_HANGUL_RATIO:
+        return "한국어로 작성된 논술문이 아닙니다."
+    if (has_passages or has_question) and max(stats["passage_overlap"], stats["question_overlap"]) < UNREVIEWABLE_MIN_OVERLAP:
+        return "제시문·질문과 관련 없는 내용으로 보입니다."
+    return None
+
+def _unreviewable_response(reason: str, stats: dict):
+    return {
+        "scores": [0, 0, 0, 0],
+        "reasons": {k: reason for k in CRITERIA_KEYS},
+        "summary": f"{reason} 내용을 보완한 뒤 다시 제출해 주세요.",
+        "analysis": stats,
+        "unreviewable": True,
+    }
+
+def _format_analysis_block(stats: dict) -> str:
+    """프롬프트에 넣을 사전 분석 요약 (구성력·분량 판단 근거)"""
+    t = stats["char_target"]
+    return "\n".join([
+        f"- 글자 수: {stats['chars']}자 (권장 {t['min']}~{t['max']}자, {'범위 내' if stats['length_ok'] else '범위 밖'})",
+        f"- 문단 수: {stats['paragraphs']}개 (들여쓰기 된 문단 {stats['indented_paragraphs']}개)",
+        f"- 문장 수: {stats['sentences']}개 (평균 {stats['sentence_mean']}자, 최장 {stats['sentence_max']}자, "
+        f"{LONG_SENTENCE_CHARS}자 초과 {stats['long_sentences']}개)",
+        f"- 제시문 어휘 활용 비율: {round(stats['passage_overlap'] * 100)}%",
+    ])
+
 # ---------- AI: Review ----------
+def _parse_review_content(content: str):
+    """모델 응답 → (scores, reasons, summary). JSON이 아니면 텍스트 형식으로 파싱."""
+    try:
+        data_json = parse_json_safely(content)
+        scores = data_json.get("scores") or [0,0,0,0]
+        reasons = data_json.get("reasons") or {}
+        summary = _s(data_json.get("summary"))
+    except Exception:
+        scores, reasons = parse_review_text(content)
+        m = re.search(r"\[총평\]\s*(.+)", content, flags=re.IGNORECASE|re.DOTALL)
+        summary = _s(m.group(1)) if m else ""
+    return scores, reasons, summary
+
+def _valid_review_content(content: str) -> bool:
+    """승격 판정: 4개 기준 모두 점수(0~10)와 이유가 있고 총평이 있어야 통과"""
+    try:
+        scores, reasons, summary = _parse_review_content(content)
+    except Exception:
+        return False
+    if not isinstance(scores, list) or len(scores) != 4:
+        return False
+    if not isinstance(reasons, dict) or not all(_s(reasons.get(k)) for k in CRITERIA_KEYS):
+        return False
+    try:
+        return all(0 <= int(x) <= 10 for x in scores) and bool(summary)
+    except Exception:
+        return False
+
+def _same_prompt(payload: dict, question: str, passages: list) -> bool:
+    """저장된 리포트와 문제·제시문이 같은지 (공백 차이는 무시)"""
+    norm = lambda t: " ".join(_s(t).split())
+    if norm(payload.get("question")) != norm(question):
+        return False
+    theirs = [norm(x) for x in _coerce_passages(payload.get("passages"))]
+    return theirs == [norm(x) for x in passages]
+
+def _review_duplicates(essay: str, question: str = "", passages=None, reuse: bool = False):
+    """
+    현재 사용자 리포트 중 유사 논술문 조회
+    - 반환: (duplicates, reused)
+    - reuse=True 이고 가장 유사한 리포트가 DUPLICATE_REUSE_THRESHOLD 이상이며
+      문제·제시문이 같고 점수가 저장돼 있으면 그 평가를 재사용(reused)
+    - 다른 문제에 낸 같은 글은 평가 기준(독해력 등)이 달라지므로 재사용하지 않음
+    """
+    db = SessionLocal()
+    try:
+        hits = find_near_duplicates(db, essay, user_id=current_user.id)
+        if not hits:
+            return [], None
+        rows = {
+            r.id: r for r in
+            db.query(Report).filter(Report.id.in_([h["report_id"] for h in hits])).all()
+        }
+    finally:
+        db.close()
+
+    duplicates = []
+    reused = None
+    for h in hits:
+        r = rows.get(h["report_id"])
+        if not r:
+            continue
+        try:
+            p = json.loads(r.payload_json)
+        except Exception:
+            p = {}
+        duplicates.append({
+            **h,
+            "student": p.get("student") or p.get("name"),
+            "created_at": r.created_at.isoformat(),
+        })
+        if (
+            reuse and reused is None
+            and h["similarity"] >= DUPLICATE_REUSE_THRESHOLD
+            and _same_prompt(p, question, passages or [])
+            and _extract_scores(p) is not None
+        ):
+            reused = {
+                "scores": _extract_scores(p),
+                "reasons": p.get("reasons") or {},
+                "summary": _s(p.get("summary")),
+                "reused_from": r.id,
+            }
+    return duplicates, reused
+
 @app.post("/api/review")
+@admission("review")
 def review_open():
     data = request.get_json(force=True)
 
@@ -591,103 +2835,57 @@ def review_open():
     if image_desc:
         passages.append(f"[자료 해석]\n{image_desc}")
 
+    # 🧮 로컬 사전 분석: 검토 불가한 글은 모델 호출 없이 바로 응답
+    char_base, char_range = _parse_char_target(data)
+    with profile_stage("analyze"):
+        analysis = analyze_essay(essay, passages, question, char_base, char_range)
+    unreviewable = _unreviewable_reason(
+        analysis,
+        has_passages=any((p or "").strip() for p in passages),
+        has_question=bool(question.strip()),
+    )
+    if unreviewable:
+        return jsonify(_unreviewable_response(unreviewable, analysis))
+
+    # 🪞 저장된 리포트 중 유사(복사) 논술문 탐지
+    duplicates = []
+    if current_user.is_authenticated:
+        try:
+            with profile_stage("duplicates"):
+                duplicates, reused = _review_duplicates(
+                    essay, question, _coerce_passages(data.get("passages")),
+                    reuse=bool(data.get("reuseDuplicate")),
+                )
+        except Exception as e:
+            print("❗ 유사 논술문 탐지 실패:", e, flush=True)
+            reused = None
+        if reused:
+            return jsonify({**reused, "duplicates": duplicates, "analysis": analysis})
+
     try:
         if client:
-            passages_block = _format_passages_block(passages, [])
+            prompt = render_review_prompt(passages, question, essay, analysis)
 
-            prompt = f"""
-당신은 초등학생을 가르치는 논술 선생님입니다.
+            content, model, usage = llm_chat(
+                "review",
+                [
+                    {
+                        "role": "system",
+                        "content": REVIEW_SYSTEM_PROMPT
+                    },
+                    {
+                        "role": "user",
+                        "content": prompt
+                    }
+                ],
+                validate=_valid_review_content,
+                temperature=0.7,
+                max_tokens=1500
+            )
 
-다음은 논술 평가 기준입니다:
-
-[논리력] 
-- 논제가 요구한 질문에 정확히 답했는가?
-- 글의 주장이 분명하게 드러났는가?
-- 제시문을 활용하여 주장을 뒷받침했는가?
-- 글 전체가 읽는 사람을 충분히 설득할 수 있을 만큼 논리적으로 전개되었는가?
-- ❗ 근거가 없거나 근거가 약하거나, 설득력이 부족한 경우에는 반드시 크게 감점하라 (0~4점 이하).
-
-[독해력] 
-- 제시문 속 핵심 내용을 올바르게 요약하거나 인용했는가?
-- 질문에 대한 답변이 글 속에서 명확하게 드러났는가?
-- 제시문을 근거로 삼아 논지를 전개했는가?
-- ❗ 제시문 외의 배경지식이나 외부 정보를 활용한 경우에는 반드시 크게 감점하라 (0~4점 이하).
-
-[구성력] 
-- 문단 구분과 들여쓰기가 잘 되어 있는가?
-- 글 전체의 논리적 흐름이 자연스럽고 방해되지 않는가?
-
-[표현력] 
-- 문법에 맞는 문장을 구사했는가?
-- 적절한 어휘를 사용했는가?
-- 맞춤법이 틀리지 않았는가?
-- 문장이 어색하거나 문법적으로 잘못된 경우(비문)는 감점하라.
-
----
-
-제시문(텍스트):
-{passages_block}
-
-질문:
-{question}
-
-논술문:
-{essay}
-
----
-
-❗ 아래 형식을 반드시 그대로 지켜서 작성해 주세요:
-
-[논리력]  
-점수: (0~10 사이의 정수만)  
-이유: (한 문장 이상 구체적으로 작성)
-
-[독해력]  
-점수: (정수만)  
-이유: (한 문장 이상 구체적으로 작성)
-
-[구성력]  
-점수: (정수만)  
-이유: (한 문장 이상 구체적으로 작성)
-
-[표현력]  
-점수: (정수만)  
-이유: (한 문장 이상 구체적으로 작성)
-
-❗ 다른 형식은 사용하지 말고 위와 같이 숫자 점수와 이유를 항목별로 분리해서 반드시 작성하세요.
-예시답안은 지금 작성하지 마세요.
-
-[총평]
-한 줄(50~100자)로 전체 인상을 요약하세요. 학생글을 기반으로 잘한 점과, 가장 미흡한 항목을 중심으로 구체적어주세요. 1문장만 작성하세요.
-""".strip()
-
-            resp = client.chat.completions.create(
-                model="gpt-4-turbo",
-                messages=[
-                    {
-                        "role": "system",
-                        "content": "너는 초등 논술 첨삭 선생님이야. 제시문과 이미지 해석 기준을 근거로 평가만 작성해."
-                    },
-                    {
-                        "role": "user",
-                        "content": prompt
-                    }
-                ],
-                temperature=0.7,
-                max_tokens=1500
-            )
-
-            content = resp.choices[0].message.content or ""
-            summary = ""
-            try:
-                data_json = parse_json_safely(content)
-                scores = data_json.get("scores") or [0,0,0,0]
-                reasons = data_json.get("reasons") or {}
-                summary = _s(data_json.get("summary"))
-            except Exception:
-                scores, reasons = parse_review_text(content)
-                m = re.search(r"\[총평\]\s*(.+)", content, flags=re.IGNORECASE|re.DOTALL)
-                summary = _s(m.group(1)) if m else ""
+            with profile_stage("parse"):
+                scores, reasons, summary = _parse_review_content(content)
+            llm_info = {"model": model, "prompt_version": PROMPT_VERSION, "usage": usage}
         else:
             scores = [8,7,7,8]
             reasons = {
@@ -697,15 +2895,36 @@ def review_open():
                 "표현력":"문법 오류가 거의 없고 어휘가 적절합니다."
             }
             summary = "전체적으로 안정적이지만, 제시문 근거를 더 명시하며 논리 전개를 강화해 보세요."
+            llm_info = None
 
-        return jsonify({"scores": scores, "reasons": reasons, "summary": summary})
+        return jsonify({
+            "scores": scores,
+            "reasons": reasons,
+            "summary": summary,
+            "duplicates": duplicates,
+            "analysis": analysis,
+            "llm": llm_info,
+        })
 
     except Exception as e:
         print("❗예외 발생 (review_open):", str(e), flush=True)
         return jsonify({"error": str(e)}), 500
     
 # ---------- AI: Example ----------
+def _valid_example_content(content: str) -> bool:
+    """승격 판정: JSON 객체이고 example/comparison 이 비어 있지 않아야 통과"""
+    try:
+        parsed = parse_json_safely(content)
+    except Exception:
+        return False
+    return (
+        isinstance(parsed, dict)
+        and bool(_s(parsed.get("example")))
+        and bool(_s(parsed.get("comparison")))
+    )
+
 @app.post("/example")
+@admission("example")
 def example():
     data = request.json or {}
 
@@ -727,12 +2946,7 @@ def example():
     if not client:
         return jsonify({"error": "OpenAI API 키가 설정되어 있지 않습니다."}), 500
 
-    try:
-        char_base = int(data.get("charBase")) if data.get("charBase") is not None else 600
-        char_range = int(data.get("charRange")) if data.get("charRange") is not None else 100
-    except Exception:
-        char_base = 600
-        char_range = 100
+    char_base, char_range = _parse_char_target(data)
 
     char_range = char_range if isinstance(char_range, int) else 100
 
@@ -741,49 +2955,12 @@ def example():
     if retry:
         min_chars += 100
 
-    passages_block = _format_passages_block(passages, [])
-
-    initial_prompt = f"""
-아래는 학생이 작성한 논술문입니다. 이 글을 바탕으로 다음 작업을 수행해 주십시오.
-
-1. 학생의 논술문을 기반으로, 평가 기준을 고려하여 예시답안을 작성하십시오.
-- 문체는 고등학교 논술 평가에 적합하게 단정하고 객관적인 서술을 유지하십시오.
-- 예시답안은 반드시 제시문(텍스트 + 이미지 해석 기준)에 포함된 정보와 주장 흐름만으로 구성하십시오.
-- 제시문 밖의 배경지식, 상식, 사례, 정의 등을 활용하면 오답으로 간주합니다.
-- 모든 주장과 근거는 반드시 제시문과 이미지 해석 기준에서만 취하십시오.
-- 예시답안 서두에 질문에 대한 명확한 답변을 반드시 제시하십시오.
-- 글자 수는 학생 논술문 기준({char_base} ± {char_range}자) 내에서 작성하십시오.
-
-2. 예시답안과 학생의 논술문을 비교하여 분석하십시오. 각 항목별로 다음을 포함하십시오:
-- 학생의 미흡한 문장 (직접 인용)
-- 어떤 평가 기준에서 부족했는가
-- 예시답안에서 어떻게 개선되었는가
-
-3. 반드시 아래 JSON 형식으로만 출력하십시오. 설명 문구를 붙이지 마십시오.
-
-{{
-  "example": "예시답안을 여기에 작성하십시오.",
-  "comparison": "비교 설명을 여기에 작성하십시오. 반드시 500~700자 분량."
-}}
-
-제시문(텍스트):
-{passages_block}
-
-질문:
-{question}
-
-학생의 논술문:
-{essay}
-""".strip()
+    initial_prompt = render_example_prompt(passages, question, essay, char_base, char_range)
 
     messages = [
         {
             "role": "system",
-            "content":
-            "너는 고등학생 논술 첨삭 선생님이다. "
-            "예시답안과 비교설명 작성 시 제시문과 이미지 해석 기준 외의 "
-            "배경지식, 사실, 사례 사용은 절대 금지다. "
-            "출력은 반드시 JSON만 사용한다."
+            "content": EXAMPLE_SYSTEM_PROMPT
         },
         {
             "role": "user",
@@ -795,19 +2972,21 @@ def example():
     example_text = ""
     comparison_text = ""
     max_attempts = 2
+    llm_calls = []
 
     for attempt in range(max_attempts):
         try:
-            res = client.chat.completions.create(
-                model="gpt-4-turbo",
-                messages=messages,
+            content, model, usage = llm_chat(
+                "example",
+                messages,
+                validate=_valid_example_content,
                 temperature=0.7,
                 max_tokens=2000,
                 response_format={"type": "json_object"}
             )
-
-            content = res.choices[0].message.content or ""
-            parsed = parse_json_safely(content)
+            llm_calls.append({"model": model, "usage": usage})
+            with profile_stage("parse"):
+                parsed = parse_json_safely(content)
 
             new_example = parsed.get("example", "")
             new_comparison = parsed.get("comparison", "")
@@ -844,11 +3023,36 @@ def example():
         "comparison": comparison_text,
         "length_valid": length_valid,
         "length_actual": len(example_text),
-        "length_note": length_note
+        "length_note": length_note,
+        "llm": {"prompt_version": PROMPT_VERSION, "calls": llm_calls}
     })
 
 
 # ---------- Reports ----------
+def _report_list_item(r: Report) -> dict:
+    """목록/검색 결과에 쓰는 리포트 요약 한 줄"""
+    try:
+        p = json.loads(r.payload_json)
+    except Exception:
+        p = {}
+    return {
+        "id": r.id,
+        "created_at": r.created_at.isoformat(),
+        "student": p.get("student") or p.get("name"),
+        "total": p.get("total"),
+        "status": p.get("status"),
+        "title": (p.get("question") or "")[:40]
+    }
+
+def _index_report(db, r: Report, data: dict):
+    """리포트 저장/수정 시 보조 인덱스를 같은 트랜잭션에서 갱신"""
+    # 🔎 검색 인덱스는 같은 트랜잭션에서 증분 반영
+    _search_index_report(db, r.id, data)
+    # 📈 점수 롤업도 함께 갱신
+    _rollup_report(db, r, data)
+    # 🪞 유사 논술문 인덱스
+    _index_essay(db, r, data)
+
 @app.post("/reports")
 @login_required
 def create_report():
@@ -862,6 +3066,8 @@ def create_report():
     try:
         r = Report(user_id=current_user.id, payload_json=payload)
         db.add(r)
+        db.flush()
+        _index_report(db, r, data)
         db.commit()
         return jsonify({"ok": True, "id": r.id, "created_at": r.created_at.isoformat()})
     finally:
@@ -879,24 +3085,258 @@ def list_reports():
             .limit(50)
             .all()
         )
-        items = []
-        for r in rows:
+        items = [_report_list_item(r) for r in rows]
+        return jsonify({"ok": True, "items": items})
+    finally:
+        db.close()
+
+@app.get("/reports/search")
+@login_required
+def search_reports():
+    """
+    리포트 검색 (학생 이름 / 질문 / 논술문 / 총평)
+    - 쿼리: q (필수), limit (기본 50, 최대 200)
+    - 본인 리포트만 검색, 관리자는 all=1 이면 전체 검색
+    """
+    q = _s(request.args.get("q"))
+    if not _search_terms(q):
+        return jsonify({"ok": False, "error": "검색어를 입력해 주세요."}), 400
+    try:
+        limit = max(1, min(200, int(request.args.get("limit", 50))))
+    except Exception:
+        limit = 50
+
+    user_id = current_user.id
+    if request.args.get("all") == "1" and _is_admin(current_user):
+        user_id = None
+
+    db = SessionLocal()
+    try:
+        ids = search_report_ids(db, q, user_id=user_id, limit=limit)
+        if not ids:
+            return jsonify({"ok": True, "items": []})
+        by_id = {r.id: r for r in db.query(Report).filter(Report.id.in_(ids)).all()}
+        items = [_report_list_item(by_id[i]) for i in ids if i in by_id]
+        return jsonify({"ok": True, "items": items})
+    finally:
+        db.close()
+
+# ---------- Analytics ----------
+def _parse_date_arg(name):
+    """YYYY-MM-DD 쿼리 파라미터 → datetime (없거나 잘못되면 None)"""
+    v = _s(request.args.get(name))
+    if not v:
+        return None
+    try:
+        return datetime.fromisoformat(v)
+    except ValueError:
+        return None
+
+def _analytics_scope_user():
+    """기본은 본인 리포트, 관리자는 all=1 이면 전체"""
+    if request.args.get("all") == "1" and _is_admin(current_user):
+        return None
+    return current_user.id
+
+@app.get("/analytics/students/<path:student>/trend")
+@login_required
+def analytics_student_trend(student):
+    """
+    학생 1명의 점수 추이
+    - 쿼리: from, to (YYYY-MM-DD, 선택)
+    - 출력: 회차별 점수, 기준별 통계, 첫 회 대비 최근 회 변화량
+    """
+    db = SessionLocal()
+    try:
+        _, created, scores = _load_score_matrix(
+            db,
+            user_id=_analytics_scope_user(),
+            student=_s(student),
+            date_from=_parse_date_arg("from"),
+            date_to=_parse_date_arg("to"),
+        )
+    finally:
+        db.close()
+
+    totals = scores.sum(axis=1)
+    points = [
+        {"created_at": created[i].isoformat(), "scores": scores[i].tolist(), "total": int(totals[i])}
+        for i in range(scores.shape[0])
+    ]
+    delta = None
+    if scores.shape[0] >= 2:
+        d = (scores[-1] - scores[0]).tolist()
+        delta = {k: int(d[i]) for i, k in enumerate(CRITERIA_KEYS)}
+
+    return jsonify({
+        "ok": True,
+        "student": _s(student),
+        "count": int(scores.shape[0]),
+        "points": points,
+        "stats": _criteria_stats(scores),
+        "delta": delta,
+    })
+
+@app.get("/analytics/summary")
+@login_required
+def analytics_summary():
+    """
+    반 전체 요약
+    - 쿼리: from, to (YYYY-MM-DD, 선택)
+    - 출력: 기준별 평균/분포(0~10점 히스토그램), 학생별 평균
+    """
+    db = SessionLocal()
+    try:
+        students, _, scores = _load_score_matrix(
+            db,
+            user_id=_analytics_scope_user(),
+            date_from=_parse_date_arg("from"),
+            date_to=_parse_date_arg("to"),
+        )
+    finally:
+        db.close()
+
+    # 기준별 0~10점 분포: 열마다 bincount
+    distributions = {
+        k: np.bincount(scores[:, i], minlength=11).tolist()
+        for i, k in enumerate(CRITERIA_KEYS)
+    }
+
+    # 학생별 평균: 학생 이름을 정수 코드로 바꿔 그룹 합계를 한 번에 계산
+    per_student = []
+    if scores.shape[0]:
+        names, codes = np.unique(students.astype(str), return_inverse=True)
+        counts = np.bincount(codes)
+        sums = np.zeros((len(names), 4), dtype=np.float64)
+        np.add.at(sums, codes, scores)
+        means = sums / counts[:, None]
+        for i, name in enumerate(names):
+            per_student.append({
+                "student": str(name),
+                "count": int(counts[i]),
+                "mean": [round(float(x), 2) for x in means[i]],
+                "total_mean": round(float(means[i].sum()), 2),
+            })
+        per_student.sort(key=lambda x: -x["total_mean"])
+
+    return jsonify({
+        "ok": True,
+        "count": int(scores.shape[0]),
+        "stats": _criteria_stats(scores),
+        "total_mean": round(float(scores.sum(axis=1).mean()), 2) if scores.shape[0] else None,
+        "distributions": distributions,
+        "students": per_student,
+    })
+
+# ---------- 관리자 리포트 내보내기 (스트리밍) ----------
+#   전체 행을 메모리에 올리지 않고 yield_per 배치로 읽으며 바로 응답에 흘려보냄
+#   (Postgres 는 stream_results 로 서버 측 커서, SQLite 는 WAL 이라 쓰기를 막지 않음)
+EXPORT_BATCH_SIZE = int(os.environ.get("EXPORT_BATCH_SIZE", "500"))
+EXPORT_CSV_COLUMNS = (
+    ["id", "user_id", "user_email", "created_at", "student", "total"]
+    + list(CRITERIA_KEYS)
+    + ["status", "question", "summary", "essay", "example", "comparison"]
+)
+
+def _iter_export_rows(user_id=None, date_from=None, date_to=None):
+    """(행, email, payload) 를 배치 단위로 yield — 세션은 제너레이터가 끝날 때 닫힘"""
+    # ORM 객체 대신 컬럼만 읽어 identity map 에 쌓이지 않도록 함
+    stmt = (
+        select(Report.id, Report.user_id, Report.created_at, Report.payload_json, User.email)
+        .outerjoin(User, User.id == Report.user_id)
+        .order_by(Report.id)
+        .execution_options(stream_results=True, yield_per=EXPORT_BATCH_SIZE)
+    )
+    if user_id is not None:
+        stmt = stmt.where(Report.user_id == user_id)
+    if date_from is not None:
+        stmt = stmt.where(Report.created_at >= date_from)
+    if date_to is not None:
+        stmt = stmt.where(Report.created_at < date_to)
+    db = SessionLocal()
+    try:
+        for r in db.execute(stmt):
+            email = r.email
             try:
-                p = json.loads(r.payload_json)
+                payload = json.loads(r.payload_json)
             except Exception:
-                p = {}
-            items.append({
-                "id": r.id,
-                "created_at": r.created_at.isoformat(),
-                "student": p.get("student") or p.get("name"),
-                "total": p.get("total"),
-                "status": p.get("status"),
-                "title": (p.get("question") or "")[:40]
-            })
-        return jsonify({"ok": True, "items": items})
+                payload = {}
+            yield r, email, payload
     finally:
         db.close()
 
+def _export_ndjson(rows):
+    buf = []
+    for r, email, payload in rows:
+        buf.append(json.dumps({
+            "id": r.id,
+            "user_id": r.user_id,
+            "user_email": email,
+            "created_at": r.created_at.isoformat() if r.created_at else None,
+            "payload": payload,
+        }, ensure_ascii=False))
+        if len(buf) >= EXPORT_BATCH_SIZE:
+            yield "\n".join(buf) + "\n"
+            buf = []
+    if buf:
+        yield "\n".join(buf) + "\n"
+
+def _export_csv(rows):
+    out = io.StringIO()
+    writer = csv.writer(out)
+    out.write("\ufeff")  # 엑셀에서 한글이 깨지지 않도록 BOM
+    writer.writerow(EXPORT_CSV_COLUMNS)
+    n = 0
+    for r, email, payload in rows:
+        scores = _extract_scores(payload) or [None] * len(CRITERIA_KEYS)
+        writer.writerow(
+            [r.id, r.user_id, email, r.created_at.isoformat() if r.created_at else "",
+             payload.get("student") or payload.get("name"), payload.get("total")]
+            + list(scores)
+            + [payload.get(k) for k in ("status", "question", "summary", "essay", "example", "comparison")]
+        )
+        n += 1
+        if n % EXPORT_BATCH_SIZE == 0:
+            yield out.getvalue()
+            out.seek(0)
+            out.truncate(0)
+    yield out.getvalue()
+
+@app.get("/admin/reports/export")
+@login_required
+def admin_export_reports():
+    """
+    리포트 전체 내보내기 (관리자 전용, 스트리밍)
+    - 쿼리: format=ndjson|csv (기본 ndjson), from, to (YYYY-MM-DD, to 는 미포함), user_id
+    """
+    if not _is_admin(current_user):
+        return jsonify({"ok": False, "error": "권한이 없습니다."}), 403
+    fmt = _s(request.args.get("format")).lower() or "ndjson"
+    if fmt not in ("ndjson", "csv"):
+        return jsonify({"ok": False, "error": "format 은 ndjson 또는 csv 입니다."}), 400
+    user_id = None
+    if _s(request.args.get("user_id")):
+        try:
+            user_id = int(request.args.get("user_id"))
+        except ValueError:
+            return jsonify({"ok": False, "error": "user_id 가 올바르지 않습니다."}), 400
+
+    rows = _iter_export_rows(
+        user_id=user_id,
+        date_from=_parse_date_arg("from"),
+        date_to=_parse_date_arg("to"),
+    )
+    stamp = datetime.utcnow().strftime("%Y%m%d_%H%M%S")
+    if fmt == "csv":
+        body, mimetype = _export_csv(rows), "text/csv; charset=utf-8"
+    else:
+        body, mimetype = _export_ndjson(rows), "application/x-ndjson; charset=utf-8"
+    resp = Response(body, mimetype=mimetype)
+    resp.headers["Content-Disposition"] = f'attachment; filename="reports_{stamp}.{fmt}"'
+    resp.headers["Cache-Control"] = "no-store"
+    resp.headers["X-Accel-Buffering"] = "no"  # nginx 버퍼링 없이 바로 전달
+    return resp
+
 @app.get("/reports/<int:rid>")
 @login_required
 def get_report(rid):
@@ -941,156 +3381,1578 @@ def report_pdf_view(report_id):
 
     finally:
         db.close()
+# ---------- 저장된 리포트 PDF (로컬 렌더링 + 디스크 캐시) ----------
+#   캐시 파일: PDF_CACHE_DIR/reports/<report id>/<engine>_<etag>.pdf
+#   - 새 버전을 만들면 같은 리포트·같은 엔진의 이전 버전만 삭제 (그 리포트 폴더만 조회)
+#   - 적중 시 mtime 갱신 → 주기적으로 오래된 것(PDF_CACHE_MAX_AGE_SEC)부터,
+#     전체 크기가 PDF_CACHE_MAX_BYTES 를 넘으면 가장 오래 안 쓴 것부터 삭제 (LRU)
+PDF_CACHE_DIR = os.environ.get("PDF_CACHE_DIR", os.path.join(tempfile.gettempdir(), "essay_pdf_cache"))
+PDF_REPORT_CACHE_DIR = os.path.join(PDF_CACHE_DIR, "reports")
+PDF_CACHE_MAX_BYTES = int(os.environ.get("PDF_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+PDF_CACHE_MAX_AGE_SEC = int(os.environ.get("PDF_CACHE_MAX_AGE_SEC", str(30 * 24 * 3600)))
+PDF_CACHE_PRUNE_INTERVAL_SEC = float(os.environ.get("PDF_CACHE_PRUNE_INTERVAL_SEC", "300"))
+PDF_TEMPLATE_PATH = os.path.join(BASE_DIR, "templates", "report_pdf.html")
+PDF_MARGIN = {"top": "20mm", "bottom": "20mm", "left": "20mm", "right": "20mm"}
+
+_template_hash_cache = {"mtime": None, "hash": ""}
+
+def _pdf_template_hash() -> str:
+    """report_pdf.html 내용 해시 (파일이 바뀌면 다시 계산)"""
+    try:
+        mtime = os.path.getmtime(PDF_TEMPLATE_PATH)
+    except OSError:
+        return ""
+    if _template_hash_cache["mtime"] != mtime:
+        with open(PDF_TEMPLATE_PATH, "rb") as f:
+            _template_hash_cache["hash"] = hashlib.sha256(f.read()).hexdigest()
+        _template_hash_cache["mtime"] = mtime
+    return _template_hash_cache["hash"]
+
+def _report_pdf_etag(report: Report, engine: str = "chromium") -> str:
+    """report id + payload + 템플릿 해시 (+ 렌더링 엔진, 폰트 모드) → 캐시 키 / ETag"""
+    h = hashlib.sha256()
+    h.update(str(report.id).encode())
+    h.update(f":{engine}:{PDF_FONT_MODE}".encode())
+    h.update(b"\0")
+    h.update(report.payload_json.encode("utf-8"))
+    h.update(b"\0")
+    h.update(_pdf_template_hash().encode())
+    return h.hexdigest()[:32]
+
+def _pdf_font_path() -> str:
+    return os.path.abspath(os.path.join(BASE_DIR, "static", "fonts")).replace("\\", "/")
+
+def render_pdf_from_html(html: str, pdf_path: str):
+    """HTML 문자열을 임시 파일로 저장해 file:// 로 열고 A4 PDF로 출력 (외부 네트워크 없음)"""
+    tmp_html = tempfile.NamedTemporaryFile(delete=False, suffix=".html", mode="w", encoding="utf-8")
+    tmp_html.write(html)
+    tmp_html.close()
+    html_path = os.path.abspath(tmp_html.name).replace("\\", "/")
+    try:
+        with sync_playwright() as p:
+            browser = p.chromium.launch(
+                headless=True,
+                args=[
+                    "--no-sandbox",
+                    "--disable-dev-shm-usage"
+                ]
+            )
+            try:
+                page = browser.new_page()
+                page.goto(f"file://{html_path}", wait_until="networkidle")
+                page.pdf(
+                    path=pdf_path,
+                    format="A4",
+                    print_background=True,
+                    prefer_css_page_size=True,
+                    margin=PDF_MARGIN
+                )
+            finally:
+                browser.close()
+    finally:
+        try:
+            os.remove(tmp_html.name)
+        except OSError:
+            pass
+
+# ---------- PDF 폰트 서브셋 ----------
+#   NotoSansKR 전체(수 MB)를 매번 읽지 않도록 필요한 글리프만 잘라 data URL로 삽입
+#   - 공통 서브셋: ASCII + KS X 1001 한글 2,350자 + 자주 쓰는 기호 → 디스크/메모리 캐시
+#   - 리포트에 공통 서브셋 밖 글자가 있으면 그 글자만 담은 작은 폰트를 unicode-range 로 추가
+#   PDF_FONT_MODE=file 이면 기존처럼 file:// TTF 전체 사용
+PDF_FONT_MODE = os.environ.get("PDF_FONT_MODE", "subset")
+PDF_FONT_CACHE_DIR = os.environ.get("PDF_FONT_CACHE_DIR", os.path.join(tempfile.gettempdir(), "essay_font_cache"))
+PDF_FONT_FILES = {400: "NotoSansKR-Regular.ttf", 500: "NotoSansKR-Medium.ttf", 700: "NotoSansKR-Bold.ttf"}
+PDF_FONT_CHARSET_VERSION = "1"  # 공통 글자 집합을 바꾸면 올릴 것 (디스크 캐시 무효화)
+
+def _build_common_charset() -> frozenset:
+    chars = {chr(c) for c in range(0x20, 0x7F)}
+    chars |= {chr(c) for c in range(0x3131, 0x318F)}  # 호환 자모 (ㅋ, ㅠ 등)
+    for c in range(0xAC00, 0xD7A4):
+        ch = chr(c)
+        try:
+            ch.encode("euc-kr")  # KS X 1001 에 있는 2,350자만
+            chars.add(ch)
+        except UnicodeEncodeError:
+            pass
+    chars |= set("·…‘’“”「」『』〈〉《》【】①②③④⑤⑥⑦⑧⑨⑩※→←↑↓○●□■△▲▽▼◇◆☆★–—～％°×÷±")
+    return frozenset(chars)
+
+PDF_FONT_COMMON_CHARS = _build_common_charset()
+
+def _subset_font_bytes(font_file: str, chars) -> bytes:
+    """fontTools 로 chars 에 해당하는 글리프만 남긴 WOFF 바이트"""
+    from fontTools import subset as ft_subset
+    from fontTools.ttLib import TTFont
+
+    opts = ft_subset.Options()
+    opts.flavor = "woff"
+    opts.hinting = False            # PDF 출력에는 힌팅 불필요
+    opts.layout_features = ["*"]
+    opts.notdef_outline = True
+    font = TTFont(font_file, lazy=True)
+    subsetter = ft_subset.Subsetter(options=opts)
+    subsetter.populate(text="".join(sorted(chars)))
+    subsetter.subset(font)
+    buf = io.BytesIO()
+    ft_subset.save_font(font, buf, opts)
+    return buf.getvalue()
+
+def _font_subset_data_url(weight: int, chars: frozenset, key: str, persist: bool):
+    """(weight, key) 단위로 캐시된 서브셋 data URL. 폰트 파일이 없으면 None."""
+    font_file = os.path.join(_pdf_font_path(), PDF_FONT_FILES[weight])
+    try:
+        st = os.stat(font_file)
+    except OSError:
+        return None
+    cache_key = hashlib.sha256(f"{font_file}:{st.st_size}:{st.st_mtime}:{key}".encode()).hexdigest()[:32]
+    # 한 워커가 만든 서브셋을 다른 워커도 바로 사용
+    url = shared_cache.get("font_url", cache_key)
+    if url:
+        return url
+
+    data = None
+    disk_path = os.path.join(PDF_FONT_CACHE_DIR, f"{cache_key}.woff")
+    if persist:
+        try:
+            with open(disk_path, "rb") as f:
+                data = f.read()
+        except OSError:
+            data = None
+    if data is None:
+        t0 = time.perf_counter()
+        data = _subset_font_bytes(font_file, chars)
+        metric_observe("pdf_font_subset_sec", time.perf_counter() - t0, kind="common" if persist else "extra")
+        if persist:
+            os.makedirs(PDF_FONT_CACHE_DIR, exist_ok=True)
+            tmp = f"{disk_path}.{os.getpid()}.tmp"
+            with open(tmp, "wb") as f:
+                f.write(data)
+            os.replace(tmp, disk_path)
+
+    url = "data:font/woff;base64," + base64.b64encode(data).decode("ascii")
+    # 리포트별 서브셋은 만료를 두어 캐시에 쌓이지 않도록 함
+    shared_cache.set("font_url", cache_key, url, ttl=None if persist else 3600)
+    metric_observe("pdf_font_bytes", len(data), kind="common" if persist else "extra")
+    return url
+
+def _unicode_range(chars) -> str:
+    return ", ".join(f"U+{ord(c):04X}" for c in sorted(chars))
+
+def pdf_font_faces(text_: str):
+    """
+    report_pdf.html 의 font_faces 값
+    - 공통 서브셋 3종(400/500/700) + 필요 시 리포트 전용 추가 글자 서브셋
+    - fontTools 가 없거나 폰트 파일이 없으면 None (템플릿이 file:// 방식으로 대체)
+    """
+    if PDF_FONT_MODE != "subset":
+        return None
+    try:
+        import fontTools  # noqa: F401
+    except ImportError:
+        return None
+
+    extra = frozenset(c for c in set(text_ or "") if c not in PDF_FONT_COMMON_CHARS and ord(c) > 0x7F)
+    extra_key = "extra:" + hashlib.sha256("".join(sorted(extra)).encode("utf-8")).hexdigest()
+    faces = []
+    try:
+        for weight in PDF_FONT_FILES:
+            url = _font_subset_data_url(weight, PDF_FONT_COMMON_CHARS, f"common:{PDF_FONT_CHARSET_VERSION}", persist=True)
+            if url is None:
+                return None
+            faces.append({"weight": weight, "src": url, "format": "woff", "unicode_range": None})
+            if extra:
+                faces.append({
+                    "weight": weight,
+                    "src": _font_subset_data_url(weight, extra, extra_key, persist=False),
+                    "format": "woff",
+                    "unicode_range": _unicode_range(extra),
+                })
+    except Exception as e:
+        print("❗ 폰트 서브셋 실패 (원본 폰트 사용):", e, flush=True)
+        return None
+    return faces
+
+def _report_payload(report: Report) -> dict:
+    """저장된 리포트 payload (+ 작성일 기본값)"""
+    try:
+        payload = json.loads(report.payload_json)
+    except Exception:
+        payload = {}
+    payload.setdefault("created_at", report.created_at.strftime("%Y-%m-%d"))
+    return payload
+
+def _report_pdf_html(payload: dict, report=None):
+    """payload → (report_pdf.html 렌더 결과, 레이더 차트 파일 경로 또는 None)"""
+    chart_path = None
+    scores = _extract_scores(payload)
+    if scores is not None:
+        try:
+            with profile_stage("chart"):
+                chart_path = generate_radar_chart(scores)
+            payload["chart_image_url"] = chart_path
+        except Exception as e:
+            print("❗ radar chart 생성 실패:", e, flush=True)
+    font_faces = pdf_font_faces(json.dumps(payload, ensure_ascii=False))
+    html = render_template(
+        "report_pdf.html",
+        report=report,
+        payload=payload,
+        font_path=_pdf_font_path(),
+        font_faces=font_faces
+    )
+    return html, chart_path
+
+def _pdf_font_label() -> str:
+    """메트릭 구분용: 서브셋 사용 여부"""
+    return "subset" if PDF_FONT_MODE == "subset" else "file"
+
+# ---------- 브라우저 없는 PDF 엔진 (fpdf2) ----------
+#   report_pdf.html 과 같은 3페이지 구성(표지 / 원자료 / 분석)을 직접 배치
+#   PDF_ENGINE=native 또는 요청의 engine 값으로 선택, 실패 시 Chromium 으로 대체
+PDF_ENGINE = os.environ.get("PDF_ENGINE", "chromium")
+PDF_ENGINES = ("chromium", "native")
+
+_PDF_BRAND = (33, 64, 177)
+_PDF_INK = (17, 24, 39)
+_PDF_MUTED = (107, 114, 128)
+_PDF_SOFT = (241, 244, 252)
+_PDF_SCORE_SCALES = {
+    "논리력": "논제가 묻는 것에 답했는가 · 주장/근거의 연결",
+    "독해력": "제시문 기반 구성 · 해석의 정확성",
+    "구성력": "문단 구분 · 흐름의 자연스러움 · 들여쓰기",
+    "표현력": "문법/맞춤법 · 어휘 선택 · 문장 완성도",
+}
+
+def _pdf_engine(requested=None) -> str:
+    engine = _s(requested).lower() or PDF_ENGINE
+    return engine if engine in PDF_ENGINES else "chromium"
+
+def render_pdf_native(payload: dict, pdf_path: str):
+    """fpdf2 로 리포트 PDF 생성 (한글 줄바꿈 + 폰트 서브셋 임베딩은 fpdf2 가 처리)"""
+    from fpdf import FPDF
+
+    font_dir = _pdf_font_path()
+    regular = os.path.join(font_dir, PDF_FONT_FILES[400])
+    bold = os.path.join(font_dir, PDF_FONT_FILES[700])
+    if not (os.path.exists(regular) and os.path.exists(bold)):
+        raise FileNotFoundError("NotoSansKR 폰트 파일이 없습니다.")
+
+    student = _s(payload.get("student") or payload.get("name")) or "학생"
+    created = _s(payload.get("created_at")) or "-"
+    scores = payload.get("scores") or []
+    reasons = payload.get("reasons") or {}
+
+    pdf = FPDF(format="A4", unit="mm")
+    pdf.set_margins(20, 20, 20)
+    pdf.set_auto_page_break(True, margin=22)
+    pdf.add_font("NotoSansKR", "", regular)
+    pdf.add_font("NotoSansKR", "B", bold)
+    width = pdf.w - pdf.l_margin - pdf.r_margin
+
+    def font(size, bold_=False, color=_PDF_INK):
+        pdf.set_font("NotoSansKR", "B" if bold_ else "", size)
+        pdf.set_text_color(*color)
+
+    def header(title, sub):
+        pdf.add_page()
+        pdf.set_fill_color(*_PDF_BRAND)
+        pdf.rect(pdf.l_margin, pdf.t_margin - 8, width, 1.6, style="F")
+        font(9, True, _PDF_BRAND)
+        pdf.cell(width / 2, 5, title)
+        font(8.5, color=_PDF_MUTED)
+        pdf.cell(width / 2, 5, student, align="R", new_x="LMARGIN", new_y="NEXT")
+        pdf.cell(width / 2, 5, sub)
+        pdf.cell(width / 2, 5, created, align="R", new_x="LMARGIN", new_y="NEXT")
+        pdf.ln(6)
+
+    def section(title):
+        pdf.ln(2)
+        pdf.set_fill_color(*_PDF_BRAND)
+        pdf.rect(pdf.l_margin, pdf.get_y() + 1.2, 1.2, 4.2, style="F")
+        pdf.set_x(pdf.l_margin + 3)
+        font(11.5, True)
+        pdf.cell(0, 6.5, title, new_x="LMARGIN", new_y="NEXT")
+        pdf.ln(1)
+
+    def body(text_, size=10.5, fill=False):
+        font(size)
+        if fill:
+            pdf.set_fill_color(*_PDF_SOFT)
+        pdf.multi_cell(0, size * 0.62, _s(text_) or "-", fill=fill, padding=(2.5, 3) if fill else 0,
+                       new_x="LMARGIN", new_y="NEXT")
+        pdf.ln(2)
+
+    def footer(label):
+        pdf.ln(4)
+        font(8.5, color=_PDF_MUTED)
+        pdf.cell(width / 2, 5, "아카데미창 · 다쓰 리포트")
+        pdf.cell(width / 2, 5, label, align="R", new_x="LMARGIN", new_y="NEXT")
+
+    # ----- PAGE 1: 표지 -----
+    header("아카데미창 · 다쓰 리포트", "Essay Diagnostic Report")
+    font(20, True)
+    pdf.multi_cell(0, 11, f"{student} 학생 분석 리포트", new_x="LMARGIN", new_y="NEXT")
+    if payload.get("status_label"):
+        font(10, True, _PDF_BRAND)
+        pdf.cell(0, 6, _s(payload.get("status_label")), new_x="LMARGIN", new_y="NEXT")
+    pdf.ln(4)
+    col = width / 3
+    font(8.5, color=_PDF_MUTED)
+    for label in ("작성일", "총점", "평가 요약"):
+        pdf.cell(col, 5, label)
+    pdf.ln(5)
+    font(13, True)
+    pdf.cell(col, 8, created)
+    pdf.cell(col, 8, f"{_s(payload.get('total')) or '-'} / 40")
+    pdf.cell(col, 8, _s(payload.get("status_label")) or "진단 완료", new_x="LMARGIN", new_y="NEXT")
+    font(8.5, color=_PDF_MUTED)
+    pdf.multi_cell(0, 5, _s(payload.get("status_desc")) or "총점은 4개 기준 합산 점수입니다.",
+                   new_x="LMARGIN", new_y="NEXT")
+    section("질문")
+    body(payload.get("question"))
+    section("한 줄 총평")
+    body(payload.get("summary"), fill=True)
+    footer("Page 1")
+
+    # ----- PAGE 2: 제시문 + 논술문 -----
+    header("원자료 · 제시문 및 학생 논술문", "Source Texts & Student Essay")
+    section("제시문")
+    passages = _coerce_passages(payload.get("passages"))
+    if passages:
+        for i, ptxt in enumerate(passages, 1):
+            font(8.5, color=_PDF_MUTED)
+            pdf.cell(0, 5, f"PASSAGE {i}", new_x="LMARGIN", new_y="NEXT")
+            body(ptxt, size=10, fill=True)
+    else:
+        body("제시문이 제공되지 않았습니다.")
+    section("학생 논술문")
+    body(payload.get("essay"))
+    footer("Page 2")
+
+    # ----- PAGE 3: 점수 + 예시답안 + 비교 -----
+    header("분석 · 점수 및 피드백", "Score Analysis & Feedback")
+    section("세부 점수 분석")
+    for i, key in enumerate(CRITERIA_KEYS):
+        score = scores[i] if isinstance(scores, list) and i < len(scores) else "-"
+        font(11.5, True)
+        pdf.cell(width - 30, 7, key)
+        font(14, True, _PDF_BRAND)
+        pdf.cell(30, 7, f"{score}점", align="R", new_x="LMARGIN", new_y="NEXT")
+        font(8.5, color=_PDF_MUTED)
+        pdf.cell(0, 5, _PDF_SCORE_SCALES[key], new_x="LMARGIN", new_y="NEXT")
+        body(reasons.get(key) if isinstance(reasons, dict) else "-", size=10)
+
+    chart_path = None
+    chart_scores = _extract_scores(payload)
+    if chart_scores is not None:
+        try:
+            with profile_stage("chart"):
+                chart_path = generate_radar_chart(chart_scores)
+            section("시각화")
+            pdf.image(chart_path, x=pdf.l_margin + width / 4, w=width / 2)
+        except Exception as e:
+            print("❗ radar chart 생성 실패:", e, flush=True)
+    try:
+        section("예시답안")
+        body(payload.get("example"), fill=True)
+        section("비교 설명")
+        body(payload.get("comparison"))
+        footer("Page 3")
+        pdf.output(pdf_path)
+    finally:
+        if chart_path:
+            try:
+                os.remove(chart_path)
+            except OSError:
+                pass
+
+def render_payload_pdf(payload: dict, pdf_path: str, engine=None, report=None) -> str:
+    """선택한 엔진으로 payload → PDF. 실제로 사용한 엔진 이름을 반환."""
+    engine = _pdf_engine(engine)
+    if engine == "native":
+        try:
+            with profile_stage("pdf:native"):
+                render_pdf_native(dict(payload), pdf_path)
+            return "native"
+        except Exception as e:
+            print("❗ native PDF 생성 실패 (Chromium으로 대체):", e, flush=True)
+            metric_inc("pdf_native_fallback")
+
+    chart_path = None
+    try:
+        with profile_stage("pdf:html"):
+            html, chart_path = _report_pdf_html(payload, report=report)
+        with profile_stage("pdf:chromium"):
+            render_pdf_from_html(html, pdf_path)
+    finally:
+        # 차트 이미지는 PDF에 이미 들어갔으므로 삭제
+        if chart_path:
+            try:
+                os.remove(chart_path)
+            except OSError:
+                pass
+    return "chromium"
+
+def _report_pdf_cache_path(report_id: int, engine: str, etag: str) -> str:
+    return os.path.join(PDF_REPORT_CACHE_DIR, str(report_id), f"{engine}_{etag}.pdf")
+
+def _render_report_pdf(report: Report, cache_path: str, engine: str):
+    """저장된 리포트를 렌더링해 cache_path 에 기록"""
+    report_dir = os.path.dirname(cache_path)
+    os.makedirs(report_dir, exist_ok=True)
+    tmp_pdf = f"{cache_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    used = render_payload_pdf(_report_payload(report), tmp_pdf, engine=engine, report=report)
+    os.replace(tmp_pdf, cache_path)
+
+    # 같은 리포트·같은 엔진의 이전 버전(payload/템플릿 변경 전) PDF 삭제 — 다른 엔진 캐시는 유지
+    prefix = f"{engine}_"
+    keep = os.path.basename(cache_path)
+    for name in os.listdir(report_dir):
+        if name.startswith(prefix) and name.endswith(".pdf") and name != keep:
+            try:
+                os.remove(os.path.join(report_dir, name))
+            except OSError:
+                pass
+    _maybe_prune_pdf_cache()
+    return used
+
+_pdf_cache_prune_state = {"next": 0.0}
+_pdf_cache_prune_lock = threading.Lock()
+
+def prune_pdf_cache() -> int:
+    """리포트 PDF 캐시를 나이·전체 크기 상한에 맞게 정리. 삭제한 파일 수를 반환."""
+    now = time.time()
+    files = []
+    removed = 0
+    try:
+        report_dirs = list(os.scandir(PDF_REPORT_CACHE_DIR))
+    except FileNotFoundError:
+        report_dirs = []
+    for d in report_dirs:
+        if not d.is_dir():
+            continue
+        try:
+            entries = list(os.scandir(d.path))
+        except OSError:
+            continue
+        for e in entries:
+            try:
+                st = e.stat()
+            except OSError:
+                continue
+            # 오래 남은 임시 파일(렌더링 중 종료)도 나이 기준으로 함께 정리
+            files.append((st.st_mtime, st.st_size, e.path))
+        if not entries:
+            try:
+                # 방금 만든 폴더는 렌더링 중일 수 있으므로 건드리지 않음
+                if now - d.stat().st_mtime > PDF_CACHE_PRUNE_INTERVAL_SEC:
+                    os.rmdir(d.path)
+            except OSError:
+                pass
+
+    files.sort()
+    total = sum(size for _, size, _ in files)
+    for mtime, size, path in files:
+        if now - mtime <= PDF_CACHE_MAX_AGE_SEC and total <= PDF_CACHE_MAX_BYTES:
+            break
+        try:
+            os.remove(path)
+            removed += 1
+        except OSError:
+            pass
+        total -= size
+
+    # 이전 형식(PDF_CACHE_DIR/report_<id>_<etag>.pdf) 캐시 파일 정리
+    try:
+        with os.scandir(PDF_CACHE_DIR) as it:
+            for e in it:
+                if e.name.startswith("report_") and e.is_file():
+                    try:
+                        os.remove(e.path)
+                        removed += 1
+                    except OSError:
+                        pass
+    except FileNotFoundError:
+        pass
+    if removed:
+        metric_inc("pdf_cache_pruned", removed)
+    return removed
+
+def _maybe_prune_pdf_cache():
+    """캐시 미스 렌더링 후 호출: 프로세스당 PDF_CACHE_PRUNE_INTERVAL_SEC 마다 한 번만 전체 정리"""
+    now = time.time()
+    with _pdf_cache_prune_lock:
+        if now < _pdf_cache_prune_state["next"]:
+            return
+        _pdf_cache_prune_state["next"] = now + PDF_CACHE_PRUNE_INTERVAL_SEC * (0.5 + random.random())
+    try:
+        prune_pdf_cache()
+    except Exception as e:
+        print("❗ PDF 캐시 정리 실패:", e, flush=True)
+
 @app.route("/reports/<int:report_id>/pdf")
+@login_required
 def generate_pdf(report_id):
-
+    """
+    저장된 리포트 PDF
+    - 로컬 템플릿으로 바로 렌더링 (공개 도메인 왕복 없음)
+    - report id + payload + 템플릿 해시로 디스크 캐시, ETag/If-None-Match 지원
+    - ?engine=native|chromium 으로 렌더링 엔진 선택 (기본값 PDF_ENGINE)
+    """
     db = SessionLocal()
     try:
-        report = db.query(Report).filter_by(id=report_id).first()
-
+        q = db.query(Report).filter_by(id=report_id)
+        if not _is_admin(current_user):
+            q = q.filter_by(user_id=current_user.id)
+        report = q.first()
         if not report:
             return "존재하지 않는 리포트입니다.", 404
-
+        db.expunge(report)
     finally:
         db.close()
 
-    # 🔴 반드시 실제 배포 도메인 사용
-    base_url = "https://flask-essay-review.onrender.com"
-    target_url = f"{base_url}/reports/{report_id}/pdf-view"
-
-    with sync_playwright() as p:
-        browser = p.chromium.launch(
-            headless=True,
-            args=[
-                "--no-sandbox",
-                "--disable-dev-shm-usage"
-            ]
-        )
-
-        context = browser.new_context()
-        page = context.new_page()
+    engine = _pdf_engine(request.args.get("engine"))
+    etag = _report_pdf_etag(report, engine)
 
-        page.goto(target_url, wait_until="networkidle")
+    # 브라우저가 같은 버전을 갖고 있으면 캐시 파일 유무와 상관없이 렌더링 없이 304
+    if request.if_none_match.contains(etag):
+        metric_inc("pdf_cache", result="not_modified")
+        resp = make_response("", 304)
+        resp.set_etag(etag)
+        resp.cache_control.max_age = 0
+        return resp
 
-        # PDF 렌더 완료 신호 대기
-        page.wait_for_function("window.__PDF_READY__ === true")
+    cache_path = _report_pdf_cache_path(report_id, engine, etag)
 
-        tmp_file = tempfile.NamedTemporaryFile(delete=False, suffix=".pdf")
-        pdf_path = tmp_file.name
-
-        page.pdf(
-            path=pdf_path,
-            format="A4",
-            print_background=True,
-            margin={
-                "top": "20mm",
-                "bottom": "20mm",
-                "left": "20mm",
-                "right": "20mm"
-            }
-        )
-
-        browser.close()
+    try:
+        os.utime(cache_path)  # 적중: 최근 사용 시각 갱신 (LRU 정리 기준)
+        cached = True
+    except OSError:
+        cached = False
+
+    if not cached:
+        metric_inc("pdf_cache", result="miss")
+        ticket = None
+        if ADMISSION_ENABLED:
+            try:
+                ticket = admission_acquire("pdf", _admission_user_key())
+            except AdmissionRejected as e:
+                return _admission_rejected_response(e)
+        try:
+            t0 = time.perf_counter()
+            # 같은 리포트를 동시에 요청해도 렌더링은 한 번만
+            used = singleflight(f"pdf:{etag}", lambda: _render_report_pdf(report, cache_path, engine), endpoint="pdf")
+            metric_observe("pdf_render_sec", time.perf_counter() - t0, source="report", engine=used, fonts=_pdf_font_label())
+            metric_observe("pdf_bytes", os.path.getsize(cache_path), source="report", engine=used, fonts=_pdf_font_label())
+        finally:
+            if ticket:
+                admission_release("pdf", ticket)
+    else:
+        metric_inc("pdf_cache", result="hit")
 
     return send_file(
-        pdf_path,
+        cache_path,
         as_attachment=True,
         download_name=f"report_{report_id}.pdf",
-        mimetype="application/pdf"
+        mimetype="application/pdf",
+        etag=etag,
+        conditional=True,
+        max_age=0
     )
+# ---------- 반 전체 PDF 일괄 내보내기 ----------
+#   브라우저 1개에서 여러 페이지를 동시에 열어 렌더링 (async Playwright, 별도 스레드)
+#   ZIP: 끝나는 순서대로 바로 스트리밍 / PDF: 순서대로 한 파일로 병합
+BULK_PDF_MAX_PARALLEL = int(os.environ.get("BULK_PDF_MAX_PARALLEL", "4"))
+BULK_PDF_MAX_ITEMS = int(os.environ.get("BULK_PDF_MAX_ITEMS", "200"))
+BULK_PDF_PROGRESS_DIR = os.path.join(tempfile.gettempdir(), "essay_export_progress")
+
+class _ZipStream(io.RawIOBase):
+    """zipfile 이 쓰는 바이트를 모아 두었다가 응답으로 흘려보내는 버퍼 (seek 불가)"""
+
+    def __init__(self):
+        self._chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        self._chunks.append(bytes(b))
+        return len(b)
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+def _export_progress_path(export_id: str) -> str:
+    return os.path.join(BULK_PDF_PROGRESS_DIR, f"{export_id}.json")
+
+def _write_export_progress(export_id: str, **progress):
+    """진행 상황을 파일로 기록 (다른 워커에서도 조회 가능)"""
+    os.makedirs(BULK_PDF_PROGRESS_DIR, exist_ok=True)
+    path = _export_progress_path(export_id)
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({**progress, "updated_at": time.time()}, f)
+    os.replace(tmp, path)
+
+async def _bulk_render_async(items, out_q, parallel: int, prepare, cancel=None):
+    """
+    items: [(idx, name, payload, report)] → out_q 에 (idx, name, pdf_bytes, error) 를 끝나는 순서대로
+    - prepare(idx, payload, report) → (html_path, chart_path): 차트·HTML 준비는 별도 스레드 1개에서
+      순서대로 (pyplot 은 스레드 안전하지 않음), 준비된 것부터 바로 렌더링 → 준비와 렌더링이 겹침
+    - cancel(threading.Event) 가 설정되면 아직 시작하지 않은 항목은 건너뜀 (응답 종료 시)
+    """
+    from playwright.async_api import async_playwright
+
+    ready = asyncio.Queue(maxsize=parallel)
+
+    def cancelled():
+        return cancel is not None and cancel.is_set()
+
+    def remove_chart(chart):
+        if chart:
+            try:
+                os.remove(chart)
+            except OSError:
+                pass
+
+    async def produce():
+        for idx, name, payload, report in items:
+            if cancelled():
+                out_q.put((idx, name, None, "취소됨"))
+                continue
+            try:
+                html_path, chart = await asyncio.to_thread(prepare, idx, payload, report)
+            except Exception as e:
+                out_q.put((idx, name, None, f"HTML 준비 실패: {e}"))
+                continue
+            await ready.put((idx, name, html_path, chart))
+        for _ in range(parallel):
+            await ready.put(None)
+
+    # 브라우저가 뜨는 동안에도 첫 항목 준비를 시작
+    producer = asyncio.create_task(produce())
+    try:
+        async with async_playwright() as p:
+            browser = await p.chromium.launch(
+                headless=True,
+                args=[
+                    "--no-sandbox",
+                    "--disable-dev-shm-usage"
+                ]
+            )
+
+            async def consume():
+                while True:
+                    item = await ready.get()
+                    if item is None:
+                        return
+                    idx, name, html_path, chart = item
+                    try:
+                        if cancelled():
+                            out_q.put((idx, name, None, "취소됨"))
+                            continue
+                        page = await browser.new_page()
+                        try:
+                            await page.goto(f"file://{html_path}", wait_until="networkidle")
+                            pdf = await page.pdf(
+                                format="A4",
+                                print_background=True,
+                                prefer_css_page_size=True,
+                                margin=PDF_MARGIN
+                            )
+                            out_q.put((idx, name, pdf, None))
+                        except Exception as e:
+                            out_q.put((idx, name, None, str(e)))
+                        finally:
+                            await page.close()
+                    finally:
+                        remove_chart(chart)
+
+            try:
+                await asyncio.gather(producer, *(consume() for _ in range(parallel)))
+            finally:
+                await browser.close()
+    finally:
+        # 브라우저 실행 실패 등으로 소비되지 못한 항목의 차트 정리
+        producer.cancel()
+        while not ready.empty():
+            item = ready.get_nowait()
+            if item is not None:
+                remove_chart(item[3])
+
+def _bulk_render_worker(items, out_q, parallel: int, prepare, cancel=None):
+    """렌더링 스레드 본체 (HTML 준비 포함). 끝나면 None 을 넣어 종료를 알림."""
+    try:
+        asyncio.run(_bulk_render_async(items, out_q, parallel, prepare, cancel))
+    except Exception as e:
+        print("❗ 일괄 PDF 렌더링 실패:", e, flush=True)
+        out_q.put(("fatal", None, None, str(e)))
+    finally:
+        out_q.put(None)
+
+def _safe_filename(s: str) -> str:
+    return re.sub(r"[\\/:*?\"<>|\s]+", "_", s or "").strip("_")[:40] or "report"
+
+@app.post("/reports/export/pdf")
+@login_required
+def export_reports_pdf():
+    """
+    여러 리포트를 한 번에 PDF로 내보내기
+    - 입력: { report_ids?: [int], payloads?: [obj], format?: "zip"|"pdf", parallel?: int }
+    - 응답 헤더 X-Export-Id → GET /reports/export/<id>/progress 로 진행 상황 조회
+    """
+    data = request.get_json(force=True) or {}
+    fmt = data.get("format") or "zip"
+    if fmt not in ("zip", "pdf"):
+        return jsonify({"ok": False, "error": "format은 zip 또는 pdf 여야 합니다."}), 400
+    try:
+        parallel = max(1, min(BULK_PDF_MAX_PARALLEL, int(data.get("parallel") or BULK_PDF_MAX_PARALLEL)))
+    except Exception:
+        parallel = BULK_PDF_MAX_PARALLEL
+
+    # (이름, payload, report) 목록
+    entries = []
+    ids = [i for i in (data.get("report_ids") or []) if isinstance(i, int)]
+    if ids:
+        db = SessionLocal()
+        try:
+            q = db.query(Report).filter(Report.id.in_(ids))
+            if not _is_admin(current_user):
+                q = q.filter(Report.user_id == current_user.id)
+            by_id = {r.id: r for r in q.all()}
+            for r in by_id.values():
+                db.expunge(r)
+        finally:
+            db.close()
+        for rid in ids:
+            r = by_id.get(rid)
+            if r:
+                p = _report_payload(r)
+                entries.append((f"{_safe_filename(p.get('student') or p.get('name'))}_{rid}", p, r))
+    for p in data.get("payloads") or []:
+        if isinstance(p, dict):
+            entries.append((_safe_filename(p.get("student") or p.get("name")), dict(p), None))
+
+    if not entries:
+        return jsonify({"ok": False, "error": "내보낼 리포트가 없습니다."}), 400
+    if len(entries) > BULK_PDF_MAX_ITEMS:
+        return jsonify({"ok": False, "error": f"한 번에 최대 {BULK_PDF_MAX_ITEMS}개까지 내보낼 수 있습니다."}), 400
+
+    ticket = None
+    if ADMISSION_ENABLED:
+        try:
+            ticket = admission_acquire("pdf", _admission_user_key())
+        except AdmissionRejected as e:
+            return _admission_rejected_response(e)
+
+    # HTML·차트 준비는 렌더링 스레드에서 (첫 바이트까지 요청 스레드가 막히지 않도록)
+    work_dir = tempfile.mkdtemp(prefix="essay_export_")
+    items = [(idx, f"{idx + 1:03d}_{name}.pdf", payload, report) for idx, (name, payload, report) in enumerate(entries)]
+
+    def prepare(idx, payload, report):
+        with app.app_context():
+            html, chart = _report_pdf_html(payload, report=report)
+        html_path = os.path.join(work_dir, f"{idx}.html").replace("\\", "/")
+        try:
+            with open(html_path, "w", encoding="utf-8") as f:
+                f.write(html)
+        except OSError:
+            # 취소로 work_dir 이 이미 지워진 경우 등: 방금 만든 차트는 여기서 정리
+            if chart:
+                os.remove(chart)
+            raise
+        return html_path, chart
+
+    export_id = uuid.uuid4().hex
+    total = len(items)
+    _write_export_progress(export_id, total=total, done=0, failed=0, finished=False)
+    out_q = queue.Queue()
+    cancel = threading.Event()
+    threading.Thread(target=_bulk_render_worker, args=(items, out_q, parallel, prepare, cancel), daemon=True).start()
+    t0 = time.perf_counter()
+
+    def results():
+        """렌더링 결과를 끝나는 순서대로 꺼냄 (진행 상황 갱신 포함)"""
+        done = failed = 0
+        while True:
+            msg = out_q.get()
+            if msg is None:
+                break
+            idx, name, pdf, err = msg
+            if err:
+                failed += 1
+            else:
+                done += 1
+            _write_export_progress(export_id, total=total, done=done, failed=failed, finished=False)
+            if ticket:
+                # 항목이 끝날 때마다 임대 연장: 렌더링이 이어지는 동안 전체 PDF 상한이 유지되도록
+                admission_refresh("pdf", ticket)
+            yield msg
+        _write_export_progress(export_id, total=total, done=done, failed=failed, finished=True)
+
+    cleanup_once = threading.Lock()
+
+    def cleanup():
+        """
+        임시 폴더 삭제 + 입장권 반납 (한 번만 실행, 차트는 렌더링 스레드가 항목마다 삭제)
+        - ZIP 스트림은 resp.call_on_close 로 등록: 클라이언트가 첫 바이트 전에 끊어
+          제너레이터가 시작도 안 된 경우에도 WSGI 서버의 close() 에서 실행됨
+        """
+        if not cleanup_once.acquire(blocking=False):
+            return
+        cancel.set()
+        shutil.rmtree(work_dir, ignore_errors=True)
+        if ticket:
+            admission_release("pdf", ticket)
+        metric_observe("pdf_render_sec", time.perf_counter() - t0, source="bulk", fonts=_pdf_font_label())
+
+    if fmt == "pdf":
+        # 병합은 순서가 필요하므로 모두 끝난 뒤 한 번에
+        try:
+            from pypdf import PdfWriter, PdfReader
+        except ImportError:
+            cleanup()
+            return jsonify({"ok": False, "error": "PDF 병합에는 pypdf 패키지가 필요합니다."}), 501
+        try:
+            rendered = {}
+            errors = []
+            for idx, name, pdf, err in results():
+                if err:
+                    errors.append(f"{name}: {err}")
+                else:
+                    rendered[idx] = pdf
+            writer = PdfWriter()
+            for idx in sorted(rendered):
+                for page in PdfReader(io.BytesIO(rendered[idx])).pages:
+                    writer.add_page(page)
+            buf = io.BytesIO()
+            writer.write(buf)
+        finally:
+            cleanup()
+        if not rendered:
+            return jsonify({"ok": False, "error": "PDF 생성에 실패했습니다.", "errors": errors}), 500
+        buf.seek(0)
+        resp = send_file(buf, as_attachment=True, download_name="reports.pdf", mimetype="application/pdf")
+        resp.headers["X-Export-Id"] = export_id
+        return resp
+
+    def stream_zip():
+        sink = _ZipStream()
+        errors = []
+        with zipfile.ZipFile(sink, "w", compression=zipfile.ZIP_STORED) as zf:
+            for idx, name, pdf, err in results():
+                if err:
+                    errors.append(f"{name}: {err}")
+                    continue
+                metric_observe("pdf_bytes", len(pdf), source="bulk", fonts=_pdf_font_label())
+                zf.writestr(name, pdf)
+                yield sink.drain()
+            if errors:
+                zf.writestr("errors.txt", "\n".join(errors))
+        yield sink.drain()
+
+    resp = Response(stream_zip(), mimetype="application/zip")
+    resp.call_on_close(cleanup)
+    resp.headers["Content-Disposition"] = "attachment; filename=reports.zip"
+    resp.headers["X-Export-Id"] = export_id
+    return resp
+
+@app.get("/reports/export/<export_id>/progress")
+@login_required
+def export_progress(export_id):
+    if not re.fullmatch(r"[0-9a-f]{32}", export_id or ""):
+        return jsonify({"ok": False, "error": "잘못된 export id 입니다."}), 400
+    try:
+        with open(_export_progress_path(export_id), encoding="utf-8") as f:
+            progress = json.load(f)
+    except (OSError, ValueError):
+        return jsonify({"ok": False, "error": "존재하지 않는 내보내기입니다."}), 404
+    return jsonify({"ok": True, **progress})
+
 # 🔹 DB 없이 즉석 PDF 생성 (현재 사용하는 방식)
 @app.post("/generate-pdf")
+@admission("pdf")
 def generate_pdf_instant():
 
     data = request.get_json(force=True)
     payload = data
 
-    # ----------------------------
-    # 📊 Radar Chart 생성
-    # ----------------------------
-    scores = payload.get("scores")
+    # 엔진 선택: body.engine 또는 ?engine= (기본값 PDF_ENGINE)
+    engine = payload.pop("engine", None) or request.args.get("engine")
 
-    if scores and isinstance(scores, list) and len(scores) == 4:
-        try:
-            chart_path = generate_radar_chart(scores)
-            # 절대경로로 강제
-            payload["chart_image_url"] = os.path.abspath(chart_path)
-        except Exception as e:
-            print("❗ radar chart 생성 실패:", e, flush=True)
+    tmp_pdf = tempfile.NamedTemporaryFile(delete=False, suffix=".pdf")
+    tmp_pdf.close()
+    pdf_path = tmp_pdf.name
 
-    # ----------------------------
-    # 🔤 폰트 절대경로 생성
-    # ----------------------------
-    font_path = os.path.abspath("static/fonts").replace("\\", "/")
+    # 📊 Radar Chart + 🔤 폰트 포함 렌더링
+    t0 = time.perf_counter()
+    used = render_payload_pdf(payload, pdf_path, engine=engine)
+    metric_observe("pdf_render_sec", time.perf_counter() - t0, source="instant", engine=used, fonts=_pdf_font_label())
+    metric_observe("pdf_bytes", os.path.getsize(pdf_path), source="instant", engine=used, fonts=_pdf_font_label())
 
-    # ----------------------------
-    # HTML 렌더
-    # ----------------------------
-    html = render_template(
-        "report_pdf.html",
-        report=None,
-        payload=payload,
-        font_path=font_path
+    return send_file(
+        pdf_path,
+        as_attachment=True,
+        download_name="report.pdf",
+        mimetype="application/pdf"
     )
+# ---------------------------------------------------------------------
+# 🧵 백그라운드 작업 큐 (review / example / pdf)
+#   - 작업은 DB 테이블(jobs)에 저장 → 웹 프로세스 재시작/타임아웃에도 유지
+#   - 워커: flask --app app jobs-worker --processes N (또는 JOB_INPROCESS_WORKERS)
+#   - 임대(lease) 방식: 워커가 죽으면 locked_until 이후 다른 워커가 다시 가져감
+#   - 실패 시 지수 백오프로 재시도, 4xx 성격의 오류는 재시도하지 않음
+#   - 클라이언트는 GET /jobs/<id>?wait=초 로 롱폴링
+#   - 끝난 작업과 결과 PDF 는 JOB_RETENTION_SEC 후 워커가 정리 (이후 다운로드는 410/404)
+# ---------------------------------------------------------------------
+JOB_KINDS = ("review", "example", "pdf")
+JOB_DEFAULT_PRIORITY = {"review": 5, "example": 5, "pdf": 3}  # 클수록 먼저
+JOB_MAX_ATTEMPTS = int(os.environ.get("JOB_MAX_ATTEMPTS", "3"))
+JOB_LEASE_SEC = int(os.environ.get("JOB_LEASE_SEC", "300"))
+JOB_RETRY_BASE_SEC = float(os.environ.get("JOB_RETRY_BASE_SEC", "5"))
+JOB_POLL_SEC = float(os.environ.get("JOB_POLL_SEC", "1"))
+JOB_LONGPOLL_MAX_SEC = float(os.environ.get("JOB_LONGPOLL_MAX_SEC", "25"))
+JOB_MAX_PENDING_PER_USER = int(os.environ.get("JOB_MAX_PENDING_PER_USER", "20"))
+JOB_MAX_PENDING_PER_IP = int(os.environ.get("JOB_MAX_PENDING_PER_IP", "3"))  # 비로그인 (IP 기준)
+JOB_INPROCESS_WORKERS = int(os.environ.get("JOB_INPROCESS_WORKERS", "0"))
+JOB_RESULT_DIR = os.path.join(PDF_CACHE_DIR, "jobs")
+JOB_RETENTION_SEC = int(os.environ.get("JOB_RETENTION_SEC", str(7 * 24 * 3600)))  # 끝난 작업·결과 파일 보관 기간
+JOB_SWEEP_INTERVAL_SEC = float(os.environ.get("JOB_SWEEP_INTERVAL_SEC", "600"))
+
+class Job(Base):
+    __tablename__ = "jobs"
+    id = Column(String(32), primary_key=True)
+    kind = Column(String(20), nullable=False)
+    status = Column(String(20), nullable=False, default="queued")  # queued | running | done | failed
+    priority = Column(Integer, nullable=False, default=5)
+    user_id = Column(Integer, nullable=True, index=True)
+    client_key = Column(String(64), nullable=True, index=True)  # 대기 작업 상한 기준 (u:<id> / ip:<주소>)
+    report_id = Column(Integer, nullable=True)      # 결과를 붙일 기존 리포트
+    save_report = Column(Integer, nullable=False, default=0)  # 1이면 완료 시 새 리포트 생성
+    payload_json = Column(Text, nullable=False)
+    result_json = Column(Text, nullable=True)
+    error = Column(Text, nullable=True)
+    attempts = Column(Integer, nullable=False, default=0)
+    max_attempts = Column(Integer, nullable=False, default=JOB_MAX_ATTEMPTS)
+    run_after = Column(DateTime, default=datetime.utcnow)
+    locked_by = Column(String(64), nullable=True)
+    locked_until = Column(DateTime, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
 
-    # ----------------------------
-    # 🧾 임시 HTML 파일 생성
-    # ----------------------------
-    tmp_html = tempfile.NamedTemporaryFile(
-        delete=False,
-        suffix=".html",
-        mode="w",
-        encoding="utf-8"
+    __table_args__ = (
+        Index("ix_jobs_status_priority", "status", "priority", "run_after"),
     )
-    tmp_html.write(html)
-    tmp_html.close()
 
-    html_path = os.path.abspath(tmp_html.name).replace("\\", "/")
+Base.metadata.create_all(engine, tables=[Job.__table__])
+
+class JobFailed(Exception):
+    """재시도해도 같은 결과인 실패 (잘못된 입력 등)"""
+
+def _job_dict(job: Job) -> dict:
+    return {
+        "id": job.id,
+        "kind": job.kind,
+        "status": job.status,
+        "priority": job.priority,
+        "attempts": job.attempts,
+        "max_attempts": job.max_attempts,
+        "report_id": job.report_id,
+        "error": job.error,
+        "result": json.loads(job.result_json) if job.result_json else None,
+        "created_at": job.created_at.isoformat() if job.created_at else None,
+        "started_at": job.started_at.isoformat() if job.started_at else None,
+        "finished_at": job.finished_at.isoformat() if job.finished_at else None,
+    }
+
+def _claimable(now):
+    return or_(
+        and_(Job.status == "queued", Job.run_after <= now),
+        # 임대 만료 (워커 종료) — 재시도 횟수가 남은 경우만 다시 가져감
+        and_(Job.status == "running", Job.locked_until < now, Job.attempts < Job.max_attempts),
+    )
 
-    with sync_playwright() as p:
-        browser = p.chromium.launch(
-            headless=True,
-            args=[
-                "--no-sandbox",
-                "--disable-dev-shm-usage"
-            ]
+def _claim_job(db, worker_id: str):
+    """실행할 작업 1건을 원자적으로 가져옴 (우선순위 → 오래된 순). 없으면 None."""
+    now = datetime.utcnow()
+    # 실행 중 워커가 계속 죽는 작업(OOM 등)은 재시도 횟수를 다 쓰면 실패 처리
+    n = (
+        db.query(Job)
+        .filter(Job.status == "running", Job.locked_until < now, Job.attempts >= Job.max_attempts)
+        .update({
+            Job.status: "failed",
+            Job.error: "작업 중 워커가 종료되었습니다 (재시도 횟수 초과).",
+            Job.locked_by: None,
+            Job.locked_until: None,
+            Job.finished_at: now,
+        }, synchronize_session=False)
+    )
+    db.commit()
+    if n:
+        metric_inc("jobs_lease_exhausted", n)
+    candidates = (
+        db.query(Job.id)
+        .filter(_claimable(now))
+        .order_by(Job.priority.desc(), Job.created_at)
+        .limit(5)
+        .all()
+    )
+    for (job_id,) in candidates:
+        # 조건부 UPDATE 로 선점: 다른 워커가 먼저 가져갔으면 0건
+        n = (
+            db.query(Job)
+            .filter(Job.id == job_id)
+            .filter(_claimable(now))
+            .update({
+                Job.status: "running",
+                Job.locked_by: worker_id,
+                Job.locked_until: now + timedelta(seconds=JOB_LEASE_SEC),
+                Job.attempts: Job.attempts + 1,
+                Job.started_at: now,
+            }, synchronize_session=False)
         )
+        db.commit()
+        if n == 1:
+            return db.get(Job, job_id)
+    return None
+
+def _run_view_as_job(view, path: str, payload: dict, user_id):
+    """기존 라우트 함수를 요청 컨텍스트 안에서 그대로 실행해 JSON 결과를 얻음"""
+    view = getattr(view, "__wrapped__", view)  # 입장 제어(admission)는 워커 수로 대신함
+    with app.test_request_context(path, method="POST", json=payload):
+        if user_id is not None:
+            db = SessionLocal()
+            try:
+                user = db.get(User, user_id)
+            finally:
+                db.close()
+            if user:
+                login_user(user)
+        resp = app.make_response(view())
+        body = resp.get_json(silent=True) or {}
+    if resp.status_code >= 500:
+        raise RuntimeError(body.get("error") or f"HTTP {resp.status_code}")
+    if resp.status_code >= 400 or body.get("ok") is False:
+        raise JobFailed(body.get("error") or f"HTTP {resp.status_code}")
+    return body
+
+def _job_pdf(job: Job, payload: dict) -> dict:
+    if job.report_id:
+        db = SessionLocal()
+        try:
+            report = db.get(Report, job.report_id)
+        finally:
+            db.close()
+        if not report:
+            raise JobFailed("존재하지 않는 리포트입니다.")
+        payload = {**_report_payload(report), **payload}
+    os.makedirs(JOB_RESULT_DIR, exist_ok=True)
+    path = os.path.join(JOB_RESULT_DIR, f"{job.id}.pdf")
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with app.test_request_context():
+        used = render_payload_pdf(payload, tmp, engine=payload.pop("engine", None))
+    os.replace(tmp, path)
+    return {"ok": True, "engine": used, "bytes": os.path.getsize(path), "download": f"/jobs/{job.id}/pdf"}
+
+def _run_job(job: Job) -> dict:
+    payload = json.loads(job.payload_json)
+    if job.kind == "review":
+        return _run_view_as_job(review_open, "/api/review", payload, job.user_id)
+    if job.kind == "example":
+        return _run_view_as_job(example, "/example", payload, job.user_id)
+    if job.kind == "pdf":
+        return _job_pdf(job, payload)
+    raise JobFailed(f"알 수 없는 작업 종류: {job.kind}")
+
+def _job_report_fields(kind: str, result: dict) -> dict:
+    """작업 결과 중 리포트 payload 에 합칠 필드"""
+    if kind == "review":
+        fields = {k: result.get(k) for k in ("scores", "reasons", "summary")}
+        scores = _extract_scores(fields)
+        if scores is not None:
+            fields["total"] = sum(scores)
+        return fields
+    if kind == "example":
+        return {k: result.get(k) for k in ("example", "comparison")}
+    return {}
+
+def _attach_job_result(db, job: Job, result: dict):
+    """결과를 기존 리포트에 병합하거나(report_id) 새 리포트로 저장(save_report). 리포트 id 반환."""
+    fields = _job_report_fields(job.kind, result)
+    if not fields or job.user_id is None:
+        return job.report_id
+    if job.report_id:
+        r = db.query(Report).filter_by(id=job.report_id, user_id=job.user_id).first()
+        if not r:
+            return job.report_id
+        try:
+            data = json.loads(r.payload_json)
+        except Exception:
+            data = {}
+        data.update(fields)
+    elif job.save_report:
+        data = {**json.loads(job.payload_json), **fields}
+        r = Report(user_id=job.user_id)
+        db.add(r)
+    else:
+        return None
+    r.payload_json = json.dumps(data, ensure_ascii=False)
+    db.flush()
+    _index_report(db, r, data)
+    result["report_id"] = r.id
+    return r.id
+
+def _finish_job(db, job: Job, worker_id: str, result=None, error=None, retry=False) -> bool:
+    """
+    작업 종료 기록. 아직 이 워커가 임대를 갖고 있을 때만 반영 (조건부 UPDATE).
+    임대를 잃었으면(만료 후 다른 워커가 가져감) 아무것도 하지 않고 False.
+    """
+    now = datetime.utcnow()
+    values = {Job.locked_by: None, Job.locked_until: None, Job.error: error}
+    if error is None:
+        status = "done"
+    elif retry and job.attempts < job.max_attempts:
+        status = "queued"
+        values[Job.run_after] = now + timedelta(
+            seconds=JOB_RETRY_BASE_SEC * (2 ** (job.attempts - 1)) * (0.5 + random.random()))
+    else:
+        status = "failed"
+    values[Job.status] = status
+    if status != "queued":
+        values[Job.finished_at] = now
+
+    # 행 잠금을 먼저 잡아 같은 작업을 두 워커가 동시에 마무리하지 않도록 함
+    n = (
+        db.query(Job)
+        .filter(Job.id == job.id, Job.status == "running", Job.locked_by == worker_id)
+        .update(values, synchronize_session=False)
+    )
+    if n != 1:
+        db.rollback()
+        print(f"❗ 작업 임대를 잃어 결과를 버립니다 ({job.kind} {job.id})", flush=True)
+        metric_inc("jobs_lease_lost", kind=job.kind)
+        return False
+    if status == "done":
+        result = dict(result or {})
+        report_id = _attach_job_result(db, job, result)
+        db.query(Job).filter(Job.id == job.id).update({
+            Job.result_json: json.dumps(result, ensure_ascii=False),
+            Job.report_id: report_id,
+        }, synchronize_session=False)
+    db.commit()
+    metric_inc("jobs_finished", kind=job.kind, status=status)
+    return True
+
+def _job_heartbeat(job_id: str, worker_id: str, stop: threading.Event):
+    """실행 중 임대 연장 (JOB_LEASE_SEC 의 1/3 간격)"""
+    while not stop.wait(JOB_LEASE_SEC / 3):
+        db = SessionLocal()
+        try:
+            n = (
+                db.query(Job)
+                .filter(Job.id == job_id, Job.status == "running", Job.locked_by == worker_id)
+                .update({Job.locked_until: datetime.utcnow() + timedelta(seconds=JOB_LEASE_SEC)},
+                        synchronize_session=False)
+            )
+            db.commit()
+            if n != 1:
+                return  # 임대를 잃음 — 종료 시 _finish_job 이 결과를 버림
+        except Exception as e:
+            db.rollback()
+            print("❗ 작업 임대 연장 실패:", e, flush=True)
+        finally:
+            db.close()
 
-        page = browser.new_page()
+def sweep_finished_jobs(batch_size: int = 500) -> int:
+    """
+    보관 기간(JOB_RETENTION_SEC)이 지난 done/failed 작업 행과 결과 PDF 삭제. 지운 작업 수를 반환.
+    - 행이 없는 결과 파일(임시 파일 포함)도 수정 시각 기준으로 함께 정리
+    """
+    cutoff = datetime.utcnow() - timedelta(seconds=JOB_RETENTION_SEC)
+    removed = 0
+    while True:
+        db = SessionLocal()
+        try:
+            ids = [row[0] for row in (
+                db.query(Job.id)
+                .filter(Job.status.in_(("done", "failed")), Job.finished_at < cutoff)
+                .limit(batch_size)
+                .all()
+            )]
+            if not ids:
+                break
+            for job_id in ids:
+                try:
+                    os.remove(os.path.join(JOB_RESULT_DIR, f"{job_id}.pdf"))
+                except OSError:
+                    pass
+            db.query(Job).filter(Job.id.in_(ids)).delete(synchronize_session=False)
+            db.commit()
+            removed += len(ids)
+        finally:
+            db.close()
+        if len(ids) < batch_size:
+            break
 
-        # 🔥 핵심: file:// 방식
-        page.goto(f"file://{html_path}", wait_until="networkidle")
+    file_cutoff = time.time() - JOB_RETENTION_SEC
+    try:
+        with os.scandir(JOB_RESULT_DIR) as it:
+            for entry in it:
+                try:
+                    if entry.is_file() and entry.stat().st_mtime < file_cutoff:
+                        os.remove(entry.path)
+                except OSError:
+                    pass
+    except FileNotFoundError:
+        pass
+    if removed:
+        metric_inc("jobs_swept", removed)
+    return removed
+
+_job_sweep_state = {"next": 0.0}
+_job_sweep_lock = threading.Lock()
+
+def _maybe_sweep_jobs():
+    """워커 루프에서 호출: 프로세스당 JOB_SWEEP_INTERVAL_SEC 마다 한 번 (여러 워커가 겹쳐도 삭제는 멱등)"""
+    now = time.time()
+    with _job_sweep_lock:
+        if now < _job_sweep_state["next"]:
+            return
+        _job_sweep_state["next"] = now + JOB_SWEEP_INTERVAL_SEC * (0.5 + random.random())
+    try:
+        n = sweep_finished_jobs()
+        if n:
+            print(f"🧹 보관 기간이 지난 작업 {n}건 정리", flush=True)
+    except Exception as e:
+        print("❗ 작업 정리 실패:", e, flush=True)
+
+def run_job_worker(worker_id: str = None, stop_event=None, max_jobs: int = None):
+    """작업을 하나씩 가져와 실행하는 루프 (stop_event 가 설정되거나 max_jobs 를 채우면 종료)"""
+    worker_id = worker_id or f"{os.uname().nodename if hasattr(os, 'uname') else 'host'}:{os.getpid()}:{threading.get_ident()}"
+    done = 0
+    while not (stop_event and stop_event.is_set()):
+        _maybe_sweep_jobs()
+        db = SessionLocal()
+        try:
+            try:
+                job = _claim_job(db, worker_id)
+            except Exception as e:
+                # DB 잠금 등 일시적 오류로 워커가 죽지 않도록 기록만 하고 다시 시도
+                db.rollback()
+                print("❗ 작업 가져오기 실패:", e, flush=True)
+                metric_inc("jobs_claim_errors")
+                job = None
+            if job is None:
+                db.close()
+                time.sleep(JOB_POLL_SEC * (0.5 + random.random()))
+                continue
+            metric_observe("job_queue_wait_sec", (job.started_at - job.created_at).total_seconds(), kind=job.kind)
+            t0 = time.perf_counter()
+            stop_hb = threading.Event()
+            hb = threading.Thread(target=_job_heartbeat, args=(job.id, worker_id, stop_hb), daemon=True)
+            hb.start()
+            outcome = {}
+            try:
+                outcome["result"] = _run_job(job)
+            except JobFailed as e:
+                outcome["error"] = str(e)
+            except Exception as e:
+                print(f"❗ 작업 실패 ({job.kind} {job.id}, {job.attempts}회차):", e, flush=True)
+                outcome.update(error=str(e), retry=True)
+            finally:
+                stop_hb.set()
+                hb.join()
+            try:
+                _finish_job(db, job, worker_id, **outcome)
+            except Exception as e:
+                db.rollback()
+                if "result" in outcome:
+                    # 결과 반영(리포트 저장 등) 실패는 재시도
+                    try:
+                        _finish_job(db, job, worker_id, error=str(e), retry=True)
+                    except Exception:
+                        db.rollback()
+                print("❗ 작업 상태 기록 실패 (임대 만료 후 재시도될 수 있음):", e, flush=True)
+            metric_observe("job_run_sec", time.perf_counter() - t0, kind=job.kind)
+        finally:
+            db.close()
+        done += 1
+        if max_jobs and done >= max_jobs:
+            return
+
+def _job_worker_process(index: int):
+    # fork 된 자식은 부모의 DB 연결을 공유하지 않도록 풀을 새로 만듦
+    engine.dispose(close=False)
+    print(f"🧵 작업 워커 #{index} 시작 (pid={os.getpid()})", flush=True)
+    run_job_worker()
+
+@app.cli.command("jobs-worker")
+@click.option("--processes", default=2, help="워커 프로세스 수")
+def jobs_worker_command(processes):
+    """flask --app app jobs-worker : 작업 큐 워커 실행"""
+    if processes <= 1:
+        _job_worker_process(0)
+        return
+    import multiprocessing
+    procs = [multiprocessing.Process(target=_job_worker_process, args=(i,), daemon=True) for i in range(processes)]
+    for p in procs:
+        p.start()
+    try:
+        for p in procs:
+            p.join()
+    except KeyboardInterrupt:
+        for p in procs:
+            p.terminate()
+
+if JOB_INPROCESS_WORKERS > 0:
+    # 별도 워커를 띄우기 어려운 배포 환경용: 웹 프로세스 안에서 데몬 스레드로 실행
+    for _i in range(JOB_INPROCESS_WORKERS):
+        threading.Thread(target=run_job_worker, name=f"job-worker-{_i}", daemon=True).start()
+
+def _job_for_current_user(db, job_id: str):
+    job = db.get(Job, job_id)
+    if not job:
+        return None
+    # 로그인 사용자의 작업은 본인/관리자만, 비로그인 작업은 id 를 아는 사람만 조회
+    if job.user_id is not None:
+        if not current_user.is_authenticated:
+            return None
+        if job.user_id != current_user.id and not _is_admin(current_user):
+            return None
+    return job
+
+@app.post("/jobs")
+def submit_job():
+    """
+    작업 등록 → 즉시 job id 반환
+    - 입력: { kind: review|example|pdf, payload: {...}, priority?: 0~9,
+             report_id?: 결과를 붙일 리포트, save_report?: true 면 완료 시 새 리포트 저장 }
+    - pdf 작업은 report_id 만 주면 저장된 리포트를 렌더링
+    """
+    data = request.get_json(force=True) or {}
+    kind = _s(data.get("kind"))
+    if kind not in JOB_KINDS:
+        return jsonify({"ok": False, "error": "kind 는 review, example, pdf 중 하나입니다."}), 400
+    payload = data.get("payload") or {}
+    if not isinstance(payload, dict):
+        return jsonify({"ok": False, "error": "payload 는 객체여야 합니다."}), 400
+    try:
+        priority = max(0, min(9, int(data.get("priority", JOB_DEFAULT_PRIORITY[kind]))))
+    except (TypeError, ValueError):
+        priority = JOB_DEFAULT_PRIORITY[kind]
 
-        tmp_pdf = tempfile.NamedTemporaryFile(delete=False, suffix=".pdf")
-        pdf_path = tmp_pdf.name
+    user_id = current_user.id if current_user.is_authenticated else None
+    try:
+        report_id = int(data["report_id"]) if data.get("report_id") else None
+    except (TypeError, ValueError):
+        return jsonify({"ok": False, "error": "report_id 가 올바르지 않습니다."}), 400
+    save_report = bool(data.get("save_report"))
+    if (report_id or save_report) and user_id is None:
+        return jsonify({"ok": False, "error": "리포트에 저장하려면 로그인이 필요합니다."}), 401
 
-        page.pdf(
-            path=pdf_path,
-            format="A4",
-            print_background=True,
-            prefer_css_page_size=True,
-            margin={
-                "top": "20mm",
-                "bottom": "20mm",
-                "left": "20mm",
-                "right": "20mm"
-            }
+    db = SessionLocal()
+    try:
+        if report_id:
+            r = db.query(Report.id).filter_by(id=report_id, user_id=user_id).first()
+            if not r and not (kind == "pdf" and _is_admin(current_user)):
+                return jsonify({"ok": False, "error": "존재하지 않거나 권한이 없습니다."}), 404
+        # 워커에서는 admission 을 거치지 않으므로 등록 단계에서 사용자/IP별 대기 작업 수를 제한
+        client_key = _admission_user_key()
+        limit = JOB_MAX_PENDING_PER_USER if user_id is not None else JOB_MAX_PENDING_PER_IP
+        pending = db.query(Job).filter(Job.client_key == client_key, Job.status.in_(["queued", "running"])).count()
+        if pending >= limit:
+            return jsonify({"ok": False, "error": "대기 중인 작업이 너무 많습니다. 잠시 후 다시 시도해 주세요."}), 429
+        job = Job(
+            id=uuid.uuid4().hex,
+            kind=kind,
+            priority=priority,
+            user_id=user_id,
+            client_key=client_key,
+            report_id=report_id,
+            save_report=1 if save_report else 0,
+            payload_json=json.dumps(payload, ensure_ascii=False),
         )
+        db.add(job)
+        db.commit()
+        metric_inc("jobs_submitted", kind=kind)
+        return jsonify({"ok": True, "job": _job_dict(job)}), 202
+    finally:
+        db.close()
 
-        browser.close()
-
-    # 임시 HTML 삭제
+@app.get("/jobs/<job_id>")
+def get_job(job_id):
+    """작업 상태/결과 조회. wait=초 를 주면 끝날 때까지 최대 그 시간만큼 기다림 (롱폴링)"""
     try:
-        os.remove(tmp_html.name)
-    except:
-        pass
+        wait = max(0.0, min(JOB_LONGPOLL_MAX_SEC, float(request.args.get("wait", 0))))
+    except ValueError:
+        wait = 0.0
+    deadline = time.time() + wait
+    while True:
+        db = SessionLocal()
+        try:
+            job = _job_for_current_user(db, job_id)
+            if not job:
+                return jsonify({"ok": False, "error": "존재하지 않거나 권한이 없습니다."}), 404
+            if job.status in ("done", "failed") or time.time() >= deadline:
+                return jsonify({"ok": True, "job": _job_dict(job)})
+        finally:
+            db.close()
+        time.sleep(min(JOB_POLL_SEC, max(0.05, deadline - time.time())))
+
+@app.get("/jobs/<job_id>/pdf")
+def get_job_pdf(job_id):
+    db = SessionLocal()
+    try:
+        job = _job_for_current_user(db, job_id)
+        if not job or job.kind != "pdf":
+            return jsonify({"ok": False, "error": "존재하지 않거나 권한이 없습니다."}), 404
+        if job.status != "done":
+            return jsonify({"ok": False, "error": "아직 완료되지 않은 작업입니다."}), 409
+    finally:
+        db.close()
+    path = os.path.join(JOB_RESULT_DIR, f"{job_id}.pdf")
+    if not os.path.exists(path):
+        return jsonify({"ok": False, "error": "결과 파일이 만료되었습니다."}), 410
+    return send_file(path, as_attachment=True, download_name="report.pdf", mimetype="application/pdf")
+
+def _sqlite_stress_worker(url: str, threads: int, seconds: float, write_ratio: float, out_q):
+    """sqlite-stress 자식 프로세스: 스레드 여러 개로 읽기/쓰기를 섞어 실행하고 통계를 out_q 로 전달"""
+    eng = _create_sqlite_engine(url)
+    Session = sessionmaker(bind=eng, autocommit=False, autoflush=False)
+    lock = threading.Lock()
+    stats = {"read": [], "write": [], "errors": collections.Counter()}
+    deadline = time.time() + seconds
+
+    def loop():
+        rnd = random.Random()
+        while time.time() < deadline:
+            kind = "write" if rnd.random() < write_ratio else "read"
+            t0 = time.perf_counter()
+            db = Session()
+            try:
+                if kind == "write":
+                    db.add(Report(user_id=rnd.randint(1, 50), payload_json=json.dumps(
+                        {"student": f"학생{rnd.randint(1, 500)}", "essay": "가나다 " * 100}, ensure_ascii=False)))
+                    db.commit()
+                else:
+                    db.query(Report.id, Report.created_at).filter(Report.user_id == rnd.randint(1, 50)) \
+                        .order_by(Report.created_at.desc()).limit(50).all()
+                elapsed = time.perf_counter() - t0
+                with lock:
+                    stats[kind].append(elapsed)
+            except Exception as e:
+                db.rollback()
+                with lock:
+                    stats["errors"][f"{type(e).__name__}: {str(e)[:60]}"] += 1
+            finally:
+                db.close()
+
+    workers = [threading.Thread(target=loop) for _ in range(threads)]
+    for t in workers:
+        t.start()
+    for t in workers:
+        t.join()
+    eng.dispose()
+    out_q.put({"read": stats["read"], "write": stats["write"], "errors": dict(stats["errors"])})
+
+@app.cli.command("sqlite-stress")
+@click.option("--db", "db_path", default="", help="테스트용 SQLite 파일 (기본: 임시 파일, 운영 DB 는 건드리지 않음)")
+@click.option("--processes", default=4, help="프로세스 수 (gunicorn 워커 흉내)")
+@click.option("--threads", default=4, help="프로세스당 스레드 수")
+@click.option("--seconds", default=10.0, help="실행 시간(초)")
+@click.option("--write-ratio", default=0.3, help="쓰기 비율 (0~1)")
+def sqlite_stress_command(db_path, processes, threads, seconds, write_ratio):
+    """flask --app app sqlite-stress : 여러 프로세스/스레드 동시 읽기·쓰기 부하 테스트"""
+    import multiprocessing
+
+    tmp_dir = None
+    if not db_path:
+        tmp_dir = tempfile.mkdtemp(prefix="sqlite_stress_")
+        db_path = os.path.join(tmp_dir, "stress.db")
+    url = f"sqlite:///{os.path.abspath(db_path)}"
+    setup = _create_sqlite_engine(url)
+    Base.metadata.create_all(setup, tables=[Report.__table__])
+    setup.dispose()
+
+    out_q = multiprocessing.Queue()
+    procs = [
+        multiprocessing.Process(target=_sqlite_stress_worker, args=(url, threads, seconds, write_ratio, out_q))
+        for _ in range(processes)
+    ]
+    for p in procs:
+        p.start()
+    results = [out_q.get() for _ in procs]
+    for p in procs:
+        p.join()
+
+    errors = collections.Counter()
+    for kind in ("read", "write"):
+        lat = np.array([x for r in results for x in r[kind]] or [0.0])
+        n = sum(len(r[kind]) for r in results)
+        print(
+            f"{kind:5s}: {n}건 ({n / seconds:.0f}/s), p50 {np.quantile(lat, 0.5) * 1000:.1f} ms, "
+            f"p95 {np.quantile(lat, 0.95) * 1000:.1f} ms, p99 {np.quantile(lat, 0.99) * 1000:.1f} ms",
+            flush=True,
+        )
+    for r in results:
+        errors.update(r["errors"])
+    print(f"오류: {sum(errors.values())}건", flush=True)
+    for msg, n in errors.most_common(5):
+        print(f"  {n:5d}  {msg}", flush=True)
+    if tmp_dir:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+@app.cli.command("pdf-bench")
+@click.option("--count", default=10, help="엔진별 렌더링 횟수")
+def pdf_bench_command(count):
+    """flask --app app pdf-bench : Chromium / native 엔진 처리량·메모리 비교"""
+    sample = {
+        "student": "홍길동",
+        "question": "제시문을 바탕으로 바람직한 선택에 대해 논하시오.",
+        "passages": ["제시문 가의 내용입니다. " * 20, "제시문 나의 내용입니다. " * 20],
+        "essay": "이것은 테스트 논술문입니다. " * 60,
+        "scores": [8, 7, 8, 9],
+        "total": 32,
+        "reasons": {k: "근거를 제시문에서 찾아 잘 연결했습니다. " * 3 for k in CRITERIA_KEYS},
+        "summary": "전체적으로 안정적인 글입니다.",
+        "example": "이것은 예시답안입니다. " * 50,
+        "comparison": "학생 글은 근거 제시가 부족했으나 예시답안은 이를 보완하였다. " * 10,
+    }
+    with app.test_request_context():
+        for engine in PDF_ENGINES:
+            tracemalloc.start()
+            t0 = time.perf_counter()
+            sizes = []
+            used = None
+            try:
+                for _ in range(count):
+                    fd, path = tempfile.mkstemp(suffix=".pdf")
+                    os.close(fd)
+                    try:
+                        used = render_payload_pdf(dict(sample), path, engine=engine)
+                        sizes.append(os.path.getsize(path))
+                    finally:
+                        os.remove(path)
+            except Exception as e:
+                tracemalloc.stop()
+                print(f"{engine:8s}: 실패 - {e}", flush=True)
+                continue
+            elapsed = time.perf_counter() - t0
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            # Chromium 은 별도 프로세스라 자식 프로세스 최대 RSS 도 함께 표시
+            child_rss = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss if resource else 0
+            print(
+                f"{engine:8s} (실제 {used}): {count / elapsed:.2f} renders/s, "
+                f"평균 {elapsed / count * 1000:.0f} ms, 평균 {sum(sizes) / len(sizes) / 1024:.0f} KB, "
+                f"Python 최대 할당 {peak / 1024 / 1024:.1f} MB, 자식 최대 RSS {child_rss / 1024:.0f} MB",
+                flush=True,
+            )
 
-    return send_file(
-        pdf_path,
-        as_attachment=True,
-        download_name="report.pdf",
-        mimetype="application/pdf"
-    )
 # ---------------------------------------------------------------------
 # Main
 # ---------------------------------------------------------------------